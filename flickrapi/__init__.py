@@ -47,9 +47,12 @@ __author__ = u'Sybren St\u00fcvel'.encode('utf-8')
 import sys
 import urllib
 import urllib2
+import httplib
+import socket
 import os.path
 import logging
 import copy
+import time
 import webbrowser
 
 # Smartly import hashlib and fall back on md5
@@ -59,9 +62,13 @@ except ImportError: from md5 import md5
 from flickrapi.tokencache import TokenCache, SimpleTokenCache, \
         LockingTokenCache
 from flickrapi.xmlnode import XMLNode
+from flickrapi.xmlstream import StreamedResponse, ElementTree
 from flickrapi.multipart import Part, Multipart, FilePart
 from flickrapi.exceptions import *
-from flickrapi.cache import SimpleCache
+from flickrapi.cache import SimpleCache, LRUCache, DiskCache
+from flickrapi.httppool import ConnectionPool
+from flickrapi.throttle import Throttle
+from flickrapi.retry import RetryPolicy
 from flickrapi import reportinghttp
 
 logging.basicConfig()
@@ -156,7 +163,7 @@ class FlickrAPI(object):
 
     def __init__(self, api_key, secret=None, username=None,
             token=None, format='etree', store_token=True,
-            cache=False):
+            cache=False, pool_size=8):
         """Construct a new FlickrAPI instance for a given API key
         and secret.
         
@@ -180,6 +187,10 @@ class FlickrAPI(object):
             unparsed response from method calls. It's also possible to pass the
             ``format`` parameter on individual calls.
 
+            Use "stream" on individual calls that return a list, such as
+            ``people_getPhotos``, to get the records as they are parsed; see
+            `flickrapi.xmlstream`.
+
         store_token
             Disables the on-disk token cache if set to False (default is True).
             Use this to ensure that tokens aren't read nor written to disk, for
@@ -191,7 +202,35 @@ class FlickrAPI(object):
             instantiate a cache yourself too:
 
             >>> f = FlickrAPI(api_key='123')
-            >>> f.cache = SimpleCache(timeout=5, max_entries=100)
+            >>> f.cache = LRUCache(timeout=5, max_entries=100)
+
+            To keep responses across runs, use a ``DiskCache``:
+
+            >>> f.cache = DiskCache('cache.db', timeout=3600)
+
+        pool_size
+            The number of idle keep-alive connections kept for REST calls.
+            Set to 0 to open a new connection for every call. Connections
+            are not pooled when an HTTP proxy is configured, since those
+            are only honoured by urllib2.
+
+        To keep the calls under a rate and adapt their concurrency when
+        Flickr is overloaded, set a ``Throttle``:
+
+            >>> f = FlickrAPI(api_key='123')
+            >>> f.throttle = Throttle(rate=3600, concurrency=8)
+
+        Calls that fail for a passing reason, like a network error or
+        Flickr being unavailable, are made again when there's a
+        ``RetryPolicy``:
+
+            >>> f.retry = RetryPolicy(tries=5)
+
+        A cached token is checked with Flickr by ``get_token_part_one``.
+        To trust a token that was found valid less than a day ago without
+        checking it again, set ``token_check_interval`` in seconds:
+
+            >>> f.token_check_interval = 86400
         """
         
         self.api_key = api_key
@@ -212,10 +251,19 @@ class FlickrAPI(object):
             self.token_cache = TokenCache(api_key, username)
 
         if cache:
-            self.cache = SimpleCache()
+            self.cache = LRUCache()
         else:
             self.cache = None
 
+        if pool_size and not urllib.getproxies().get('http'):
+            self.http_pool = ConnectionPool(self.flickr_host, pool_size)
+        else:
+            self.http_pool = None
+
+        self.throttle = None
+        self.retry = None
+        self.token_check_interval = 0
+
     def __repr__(self):
         '''Returns a string representation of this object.'''
 
@@ -260,16 +308,6 @@ class FlickrAPI(object):
     def parse_etree(self, rest_xml):
         '''Parses a REST XML response from Flickr into an ElementTree object.'''
 
-        try:
-            import xml.etree.ElementTree as ElementTree
-        except ImportError:
-            # For Python 2.4 compatibility:
-            try:
-                import elementtree.ElementTree as ElementTree
-            except ImportError:
-                raise ImportError("You need to install "
-                    "ElementTree for using the etree format")
-
         rsp = ElementTree.fromstring(rest_xml)
         if rsp.attrib['stat'] == 'ok':
             return rsp
@@ -277,6 +315,15 @@ class FlickrAPI(object):
         err = rsp.find('err')
         raise FlickrError(u'Error: %(code)s: %(msg)s' % err.attrib, err.attrib['code'])
 
+    @rest_parser('stream')
+    def parse_stream(self, rest_xml):
+        '''Parses a REST XML response from Flickr incrementally into a
+        StreamedResponse, which yields the records of the response while
+        they are parsed.
+        '''
+
+        return StreamedResponse(rest_xml)
+
     def sign(self, dictionary):
         """Calculate the flickr signature for a set of params.
         
@@ -395,19 +442,76 @@ class FlickrAPI(object):
         post_data = self.encode_and_sign(kwargs)
 
         # Return value from cache if available
-        if self.cache and self.cache.get(post_data):
-            return self.cache.get(post_data)
-
-        url = "http://" + self.flickr_host + self.flickr_rest_form
-        flicksocket = urllib2.urlopen(url, post_data)
-        reply = flicksocket.read()
-        flicksocket.close()
-
-        # Store in cache, if we have one
         if self.cache is not None:
+            reply = self.cache.get(post_data)
+            if reply is not None:
+                return reply
+
+        attempt = 1
+        while True:
+            try:
+                reply = self.__flickr_post(post_data)
+            except Exception, e:
+                if self.retry is None or attempt >= self.retry.tries \
+                        or not self.retry.retryable_error(e):
+                    raise
+                LOG.warning('Calling %s failed, retrying: %s'
+                        % (kwargs.get('method'), e))
+            else:
+                if self.retry is None or attempt >= self.retry.tries \
+                        or not self.retry.retryable_reply(reply):
+                    break
+                LOG.warning('Calling %s failed, retrying'
+                        % kwargs.get('method'))
+
+            self.retry.wait(attempt)
+            attempt += 1
+
+        # Store in cache, if we have one. Errors are likely to be
+        # transient, so those aren't kept.
+        if self.cache is not None and 'stat="fail"' not in reply \
+                and '"stat":"fail"' not in reply:
             self.cache.set(post_data, reply)
 
         return reply
+
+    def __flickr_post(self, post_data):
+        '''POSTs the encoded and signed ``post_data`` to the REST
+        interface and returns the unparsed reply, going through the
+        throttle if there is one.
+        '''
+
+        ticket = None
+        if self.throttle is not None:
+            ticket = self.throttle.acquire()
+
+        overloaded = False
+        try:
+            try:
+                if self.http_pool is not None:
+                    reply = self.http_pool.post(self.flickr_rest_form, post_data)
+                else:
+                    url = "http://" + self.flickr_host + self.flickr_rest_form
+                    flicksocket = urllib2.urlopen(url, post_data)
+                    reply = flicksocket.read()
+                    flicksocket.close()
+            except urllib2.HTTPError, e:
+                overloaded = e.code >= 500 or e.code == 429
+                raise
+            except (urllib2.URLError, httplib.HTTPException, socket.error):
+                # Timeouts and dropped connections are as much a sign
+                # of an overloaded server as an error status is
+                overloaded = True
+                raise
+
+            # Flickr reports being overloaded as error 105
+            if 'stat="fail"' in reply or '"stat":"fail"' in reply:
+                overloaded = 'code="105"' in reply or '"code":105' in reply
+        finally:
+            if self.throttle is not None:
+                self.throttle.release(ticket, overloaded)
+
+        return reply
     
     def __wrap_in_parser(self, wrapped_method, parse_format, *args, **kwargs):
         '''Wraps a method call in a parser.
@@ -660,7 +764,8 @@ class FlickrAPI(object):
         
         This first attempts to find a token in the user's token cache
         on disk. If that token is present and valid, it is returned by
-        the method.
+        the method. A token found valid within the last
+        ``token_check_interval`` seconds is not checked again.
         
         If that fails (or if the token is no longer valid based on
         flickr.auth.checkToken) a new frob is acquired. If an auth_callback 
@@ -724,18 +829,28 @@ class FlickrAPI(object):
 
         # see if it's valid
         if token:
-            LOG.debug("Trying cached token '%s'" % token)
-            try:
-                rsp = self.auth_checkToken(auth_token=token, format='xmlnode')
-
-                # see if we have enough permissions
-                tokenPerms = rsp.auth[0].perms[0].text
+            checked = self.token_cache.get_checked(token)
+            if checked is not None and \
+                    time.time() - checked[0] < self.token_check_interval:
+                LOG.debug("Cached token '%s' was valid %d seconds ago"
+                        % (token, time.time() - checked[0]))
+                tokenPerms = checked[1]
+            else:
+                LOG.debug("Trying cached token '%s'" % token)
+                try:
+                    rsp = self.auth_checkToken(auth_token=token,
+                            format='xmlnode')
+                    tokenPerms = rsp.auth[0].perms[0].text
+                    self.token_cache.set_checked(token, tokenPerms)
+                except FlickrError:
+                    LOG.debug("Cached token invalid")
+                    self.token_cache.forget()
+                    token = None
+
+            # see if we have enough permissions
+            if token:
                 if tokenPerms == "read" and perms != "read": token = None
                 elif tokenPerms == "write" and perms == "delete": token = None
-            except FlickrError:
-                LOG.debug("Cached token invalid")
-                self.token_cache.forget()
-                token = None
 
         # get a new token if we need one
         if not token:
@@ -779,6 +894,7 @@ class FlickrAPI(object):
         
         # store the auth info for next time
         self.token_cache.token = token
+        self.token_cache.set_checked(token, rsp.auth[0].perms[0].text)
 
         return token
 
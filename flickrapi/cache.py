@@ -11,6 +11,13 @@ thanks to those guys for designing a simple and effective cache!
 
 import threading
 import time
+import re
+import sqlite3
+import heapq
+from collections import OrderedDict
+
+# The Flickr method in the POST data a response is cached under
+method_re = re.compile(r'(?:^|&)method=([^&]*)')
 
 class SimpleCache(object):
     '''Simple response cache for FlickrAPI calls.
@@ -26,6 +33,8 @@ class SimpleCache(object):
         self.default_timeout = timeout
         self.max_entries = max_entries
         self.cull_frequency = 3
+        self.hits = 0
+        self.misses = 0
 
     def locking(method):
         '''Method decorator, ensures the method call is locked'''
@@ -48,11 +57,14 @@ class SimpleCache(object):
         now = time.time()
         exp = self.expire_info.get(key)
         if exp is None:
+            self.misses += 1
             return default
         elif exp < now:
             self.delete(key)
+            self.misses += 1
             return default
 
+        self.hits += 1
         return self.storage[key]
 
     @locking
@@ -104,3 +116,339 @@ class SimpleCache(object):
 
         return len(self.storage)
 
+class LRUCache(object):
+    '''Least recently used response cache for FlickrAPI calls.
+
+    This stores max 1000 entries, timing them out after 120 seconds:
+
+    >>> cache = LRUCache(timeout=120, max_entries=1000)
+
+    When full, the least recently used entry is evicted; expired entries
+    are cleaned up as new ones are set. Every operation is O(1) (setting
+    is O(log n) for the expiry heap), and a hit is a single lookup.
+
+    For use by many threads at once the keys can be spread over several
+    independently locked stripes. Each stripe holds an equal share of
+    ``max_entries``:
+
+    >>> cache = LRUCache(timeout=120, max_entries=1000, stripes=8)
+
+    Like a ``DiskCache``, particular Flickr methods can be given their own
+    timeouts, 0 to not cache them at all:
+
+    >>> cache = LRUCache(timeout=120, max_entries=1000,
+    ...     timeouts={'flickr.photos.getFavorites': 0})
+    '''
+
+    def __init__(self, timeout=300, max_entries=200, stripes=1, timeouts=None):
+        self.default_timeout = timeout
+        self.timeouts = timeouts or {}
+        self.max_entries = max_entries
+        self.stripes = [LRUStripe(max(max_entries // stripes, 1))
+                for i in xrange(stripes)]
+
+    def stripe(self, key):
+        '''Returns the stripe that holds ``key``.'''
+
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def get(self, key, default=None):
+        '''Fetch a given key from the cache. If the key does not exist, return
+        default, which itself defaults to None.
+        '''
+
+        return self.stripe(key).get(key, default, time.time())
+
+    def timeout_for(self, key):
+        '''Returns the timeout for the Flickr method in the POST data
+        ``key``, or the default timeout for other keys.
+        '''
+
+        match = method_re.search(key)
+        if match:
+            return self.timeouts.get(match.group(1), self.default_timeout)
+
+        return self.default_timeout
+
+    def set(self, key, value, timeout=None):
+        '''Set a value in the cache. If timeout is given, that timeout will be
+        used for the key; otherwise the timeout for the Flickr method in the
+        key, or the default cache timeout, will be used. A timeout of 0
+        means the value is not cached.
+        '''
+
+        if timeout is None:
+            timeout = self.timeout_for(key)
+        if timeout <= 0:
+            return
+
+        now = time.time()
+        self.stripe(key).set(key, value, now + timeout, now)
+
+    def delete(self, key):
+        '''Deletes a key from the cache, failing silently if it doesn't exist.'''
+
+        self.stripe(key).delete(key)
+
+    def has_key(self, key):
+        '''Returns True if the key is in the cache and has not expired.'''
+        return self.get(key) is not None
+
+    def __contains__(self, key):
+        '''Returns True if the key is in the cache and has not expired.'''
+        return self.has_key(key)
+
+    def __len__(self):
+        '''Returns the number of cached items -- they might be expired
+        though.
+        '''
+
+        return sum([len(s) for s in self.stripes])
+
+    def get_hits(self):
+        return sum([s.hits for s in self.stripes])
+    hits = property(get_hits, doc='Number of lookups that found a value')
+
+    def get_misses(self):
+        return sum([s.misses for s in self.stripes])
+    misses = property(get_misses, doc='Number of lookups that did not find a value')
+
+class LRUStripe(object):
+    '''A share of the entries of an ``LRUCache`` with its own lock.'''
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # key -> (value, expires), least recently used first
+        self.entries = OrderedDict()
+
+        # Heap of (expires, key). Entries for keys that have since been
+        # set again or evicted are left in and skipped when popped.
+        self.expiry = []
+
+    def get(self, key, default, now):
+        '''Returns the value of ``key`` and marks it most recently used.'''
+
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[1] < now:
+                self.misses += 1
+                return default
+
+            # Put back at the most recently used end
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+        finally:
+            self.lock.release()
+
+    def set(self, key, value, expires, now):
+        '''Sets the value of ``key``, expiring at ``expires``.'''
+
+        self.lock.acquire()
+        try:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, expires)
+            heapq.heappush(self.expiry, (expires, key))
+
+            self.expire(now)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+            # Don't let skipped heap entries pile up
+            if len(self.expiry) > 2 * len(self.entries) + 16:
+                self.expiry = [(e[1], k) for (k, e) in self.entries.iteritems()]
+                heapq.heapify(self.expiry)
+        finally:
+            self.lock.release()
+
+    def expire(self, now):
+        '''Removes the entries that have expired by ``now``. Expects the
+        lock to be held.
+        '''
+
+        while self.expiry and self.expiry[0][0] < now:
+            (expires, key) = heapq.heappop(self.expiry)
+
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] == expires:
+                del self.entries[key]
+
+    def delete(self, key):
+        '''Deletes ``key``, failing silently if it doesn't exist.'''
+
+        self.lock.acquire()
+        try:
+            self.entries.pop(key, None)
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        return len(self.entries)
+
+class DiskCache(object):
+    '''Persistent response cache for FlickrAPI calls, kept in a single
+    SQLite file so that responses survive a restart.
+
+    This keeps at most 100 MB of responses in ``cache.db``, timing them
+    out after an hour, except that EXIF is kept for 30 days and photo
+    favorites are not cached at all:
+
+    >>> cache = DiskCache('cache.db', timeout=3600, max_bytes=100 << 20,
+    ...     timeouts={'flickr.photos.getExif': 30 * 86400,
+    ...               'flickr.photos.getFavorites': 0})
+
+    When full, the least recently used responses are evicted. The
+    ``hits`` and ``misses`` counters tell how effective the cache was.
+    '''
+
+    def __init__(self, path, timeout=300, max_bytes=64 << 20, timeouts=None):
+        self.path = path
+        self.default_timeout = timeout
+        self.max_bytes = max_bytes
+        self.timeouts = timeouts or {}
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+        # A lost cache only costs refetching, so don't wait for the disk
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, '
+                'value BLOB, size INTEGER, expires REAL, used REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS cache_used ON cache (used)')
+        self.db.execute('DELETE FROM cache WHERE expires < ?', (time.time(), ))
+        self.db.commit()
+
+        self.size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+
+    def locking(method):
+        '''Method decorator, ensures the method call is locked'''
+
+        def locked(self, *args, **kwargs):
+            self.lock.acquire()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.lock.release()
+
+        return locked
+
+    def timeout_for(self, key):
+        '''Returns the timeout for the Flickr method in the POST data
+        ``key``, or the default timeout for other keys.
+        '''
+
+        match = method_re.search(key)
+        if match:
+            return self.timeouts.get(match.group(1), self.default_timeout)
+
+        return self.default_timeout
+
+    @locking
+    def get(self, key, default=None):
+        '''Fetch a given key from the cache. If the key does not exist, return
+        default, which itself defaults to None.
+        '''
+
+        now = time.time()
+        row = self.db.execute('SELECT value, expires FROM cache WHERE key = ?',
+                (key, )).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return default
+        elif row[1] < now:
+            self.delete(key)
+            self.misses += 1
+            return default
+
+        self.db.execute('UPDATE cache SET used = ? WHERE key = ?', (now, key))
+        self.db.commit()
+
+        self.hits += 1
+        return str(row[0])
+
+    @locking
+    def set(self, key, value, timeout=None):
+        '''Set a value in the cache. If timeout is given, that timeout will be
+        used for the key; otherwise the timeout for the Flickr method in the
+        key, or the default cache timeout, will be used. A timeout of 0
+        means the value is not cached.
+        '''
+
+        if timeout is None:
+            timeout = self.timeout_for(key)
+        if timeout <= 0:
+            return
+
+        self.delete(key)
+
+        now = time.time()
+        self.db.execute('INSERT INTO cache VALUES (?, ?, ?, ?, ?)',
+                (key, sqlite3.Binary(value), len(value), now + timeout, now))
+        self.size += len(value)
+
+        if self.size > self.max_bytes:
+            self.cull()
+
+        self.db.commit()
+
+    @locking
+    def delete(self, key):
+        '''Deletes a key from the cache, failing silently if it doesn't exist.'''
+
+        row = self.db.execute('SELECT size FROM cache WHERE key = ?', (key, )).fetchone()
+        if row is not None:
+            self.db.execute('DELETE FROM cache WHERE key = ?', (key, ))
+            self.db.commit()
+            self.size -= row[0]
+
+    @locking
+    def has_key(self, key):
+        '''Returns True if the key is in the cache and has not expired.'''
+        return self.get(key) is not None
+
+    @locking
+    def __contains__(self, key):
+        '''Returns True if the key is in the cache and has not expired.'''
+        return self.has_key(key)
+
+    @locking
+    def cull(self):
+        '''Evicts the least recently used items until the cache is down to
+        90% of its maximum size, so that it isn't culled on every set.
+        '''
+
+        target = self.max_bytes * 9 // 10
+        doomed = []
+
+        for (key, size) in self.db.execute('SELECT key, size FROM cache ORDER BY used'):
+            if self.size <= target:
+                break
+
+            doomed.append((key, ))
+            self.size -= size
+
+        self.db.executemany('DELETE FROM cache WHERE key = ?', doomed)
+        self.db.commit()
+
+    @locking
+    def __len__(self):
+        '''Returns the number of cached items -- they might be expired
+        though.
+        '''
+
+        return self.db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    @locking
+    def close(self):
+        '''Closes the cache file.'''
+
+        self.db.close()
@@ -0,0 +1,135 @@
+# -*- encoding: utf-8 -*-
+
+'''Pool of persistent HTTP/1.1 connections for FlickrAPI calls.
+
+Opening a new connection for every call costs a DNS lookup and a TCP
+handshake. The pool keeps connections open between calls and hands each
+one to a single thread at a time.
+'''
+
+import httplib
+import socket
+import threading
+import logging
+import urllib2
+
+logging.basicConfig()
+LOG = logging.getLogger(__name__)
+
+__all__ = ('ConnectionPool', )
+
+class ConnectionPool(object):
+    '''Keep-alive connections to a single HTTP host.
+
+    At most ``size`` idle connections are kept. Checking out a connection
+    never blocks: when none is idle a new one is opened, and when more
+    than ``size`` are returned the extras are closed.
+
+    >>> pool = ConnectionPool('api.flickr.com', size=4)
+    >>> reply = pool.post('/services/rest/', 'method=flickr.test.echo')
+
+    The ``opened`` and ``reused`` counters tell how many requests needed
+    a new connection and how many went over an existing one.
+    '''
+
+    def __init__(self, host, size=8, timeout=None):
+        self.host = host
+        self.size = size
+        self.timeout = timeout
+
+        self.opened = 0
+        self.reused = 0
+
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def checkout(self):
+        '''Returns a tuple (connection, reused) for the calling thread
+        to use exclusively until it is checked in again.
+        '''
+
+        self.lock.acquire()
+        try:
+            if self.idle:
+                self.reused += 1
+                return (self.idle.pop(), True)
+
+            self.opened += 1
+        finally:
+            self.lock.release()
+
+        LOG.debug('Opening connection to %s' % self.host)
+        if self.timeout is None:
+            conn = httplib.HTTPConnection(self.host)
+        else:
+            conn = httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+        return (conn, False)
+
+    def checkin(self, conn):
+        '''Returns a connection to the pool, or closes it if the pool
+        is full.
+        '''
+
+        self.lock.acquire()
+        try:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        finally:
+            self.lock.release()
+
+        conn.close()
+
+    def close(self):
+        '''Closes all idle connections.'''
+
+        self.lock.acquire()
+        try:
+            idle = self.idle
+            self.idle = []
+        finally:
+            self.lock.release()
+
+        for conn in idle:
+            conn.close()
+
+    def post(self, path, body):
+        '''POSTs the URL encoded ``body`` to ``path`` and returns the
+        response body.
+
+        Raises ``urllib2.HTTPError`` for a non-200 response, like
+        ``urllib2.urlopen`` does. A reused connection that the server has
+        closed in the meantime is replaced and the request sent again.
+        '''
+
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        while True:
+            (conn, reused) = self.checkout()
+
+            try:
+                conn.request('POST', path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+
+                # Idle connections time out on the server side, so
+                # only a failure on a fresh connection is real
+                if reused:
+                    LOG.debug('Stale connection to %s, retrying' % self.host)
+                    continue
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self.checkin(conn)
+
+            if response.status != 200:
+                url = 'http://%s%s' % (self.host, path)
+                raise urllib2.HTTPError(url, response.status,
+                        response.reason, response.msg, None)
+
+            return data
@@ -0,0 +1,98 @@
+# -*- encoding: utf-8 -*-
+
+'''Retrying of FlickrAPI calls that failed for a passing reason.
+
+Network errors, HTTP 5xx responses and a few Flickr error codes mean the
+call may well succeed when made again a little later. A ``RetryPolicy``
+tells FlickrAPI to do so, waiting exponentially longer between tries with
+random jitter so that many threads don't retry in lockstep:
+
+>>> f = FlickrAPI(api_key='123')
+>>> f.retry = RetryPolicy(tries=5)
+
+Other errors, such as a photo that does not exist, are raised at once.
+'''
+
+import httplib
+import random
+import re
+import socket
+import threading
+import time
+import urllib2
+import logging
+
+logging.basicConfig()
+LOG = logging.getLogger(__name__)
+
+__all__ = ('RetryPolicy', )
+
+# Flickr error codes that can go away by themselves:
+#   0   unknown failure
+#   10  search API unavailable
+#   105 service unavailable
+#   106 write operation failed
+RETRYABLE_CODES = (0, 10, 105, 106)
+
+_code_re = re.compile(r'code"?[=:]"?(\d+)')
+
+class RetryPolicy(object):
+    '''Decides whether a failed call is tried again and how long to wait.
+
+    tries
+        Most times a call is made, including the first.
+
+    base, cap
+        The wait before the n-th retry is random between 0 and
+        ``base * 2**(n-1)`` seconds, but never more than ``cap``.
+
+    codes
+        The Flickr error codes that are retried.
+
+    The ``retries`` counter tells how many calls were made again.
+    '''
+
+    def __init__(self, tries=5, base=1.0, cap=60.0, codes=RETRYABLE_CODES):
+        self.tries = tries
+        self.base = base
+        self.cap = cap
+        self.codes = codes
+
+        self.lock = threading.Lock()
+        self.retries = 0
+
+    def retryable_error(self, error):
+        '''Returns True if the exception ``error`` raised by a call is
+        worth retrying.
+        '''
+
+        if isinstance(error, urllib2.HTTPError):
+            return error.code >= 500 or error.code == 429
+
+        return isinstance(error, (urllib2.URLError, httplib.HTTPException,
+                socket.error))
+
+    def retryable_reply(self, reply):
+        '''Returns True if ``reply`` is a failure that is worth retrying.'''
+
+        if 'stat="fail"' not in reply and '"stat":"fail"' not in reply:
+            return False
+
+        match = _code_re.search(reply)
+        if match is None:
+            return 0 in self.codes
+
+        return int(match.group(1)) in self.codes
+
+    def wait(self, attempt):
+        '''Sleeps before making the call again after ``attempt`` tries.'''
+
+        self.lock.acquire()
+        try:
+            self.retries += 1
+        finally:
+            self.lock.release()
+
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+        LOG.debug('Retrying in %.1f seconds' % delay)
+        time.sleep(delay)
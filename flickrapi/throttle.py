@@ -0,0 +1,195 @@
+# -*- encoding: utf-8 -*-
+
+'''Pacing of FlickrAPI calls.
+
+Flickr allows each API key a limited number of calls per hour, and
+answers with HTTP 5xx errors or "service unavailable" failures when it is
+overloaded. A ``Throttle`` shared by all threads using a FlickrAPI
+instance keeps the calls under a rate and adapts the number of calls in
+flight to how well Flickr is keeping up:
+
+>>> f = FlickrAPI(api_key='123')
+>>> f.throttle = Throttle(rate=3600, concurrency=8)
+'''
+
+import threading
+import time
+import logging
+
+logging.basicConfig()
+LOG = logging.getLogger(__name__)
+
+__all__ = ('RateLimiter', 'ConcurrencyGate', 'Throttle')
+
+class RateLimiter(object):
+    '''Token bucket allowing ``rate`` requests per hour.
+
+    The bucket holds up to ``burst`` tokens, by default a minute's worth,
+    so short bursts go out at once while the hourly rate is kept.
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        if burst is None:
+            burst = max(1, int(rate / 60))
+        self.burst = burst
+
+        self.tokens = float(burst)
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''Waits until a request may be made, and takes a token for it.'''
+
+        while True:
+            self.lock.acquire()
+            try:
+                now = time.time()
+                self.tokens = min(self.burst,
+                        self.tokens + (now - self.last) * self.rate / 3600)
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) * 3600 / self.rate
+            finally:
+                self.lock.release()
+
+            time.sleep(wait)
+
+class ConcurrencyGate(object):
+    '''Limits the number of requests in flight, adapting the limit with
+    additive increase and multiplicative decrease (AIMD).
+
+    Every healthy response raises the limit by ``1/limit``, so by about one
+    per round of requests, up to ``maximum``. An overloaded response halves
+    it, down to ``minimum``. Requests that were already in flight when the
+    limit was halved don't halve it again.
+    '''
+
+    def __init__(self, maximum, minimum=1):
+        self.maximum = float(maximum)
+        self.minimum = float(minimum)
+        self.limit = float(maximum)
+        self.lowest = maximum
+
+        self.active = 0
+        self.decreases = 0
+        self.cond = threading.Condition()
+
+    def enter(self):
+        '''Waits for a free slot and takes it. Returns a ticket to pass to
+        ``leave``.
+        '''
+
+        self.cond.acquire()
+        try:
+            while self.active >= int(self.limit):
+                # Waking up now and then keeps Ctrl-C working
+                self.cond.wait(0.1)
+
+            self.active += 1
+            return self.decreases
+        finally:
+            self.cond.release()
+
+    def leave(self, ticket, overloaded=False):
+        '''Frees the slot taken by ``enter``, telling whether the response
+        showed the server was ``overloaded``.
+        '''
+
+        self.cond.acquire()
+        try:
+            self.active -= 1
+
+            if overloaded:
+                if ticket == self.decreases:
+                    self.decreases += 1
+                    self.limit = max(self.minimum, self.limit / 2.0)
+                    self.lowest = min(self.lowest, int(self.limit))
+                    LOG.debug('Server overloaded, concurrency down to %d'
+                            % self.limit)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+class Throttle(object):
+    '''Rate limit and adaptive concurrency for the calls of a FlickrAPI.
+
+    rate
+        Requests per hour, or None for no limit.
+
+    concurrency
+        Most requests in flight at once, or None for no limit.
+
+    The ``requests`` and ``throttled`` counters tell how many requests
+    were made and how many of them found the server overloaded.
+    '''
+
+    def __init__(self, rate=None, concurrency=None):
+        self.limiter = None
+        if rate:
+            self.limiter = RateLimiter(rate)
+
+        self.gate = None
+        if concurrency:
+            self.gate = ConcurrencyGate(concurrency)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.started = None
+
+    def acquire(self):
+        '''Waits until a request may be made. Returns a ticket to pass to
+        ``release`` once the response is in.
+        '''
+
+        ticket = None
+        if self.gate is not None:
+            ticket = self.gate.enter()
+
+        if self.limiter is not None:
+            try:
+                self.limiter.acquire()
+            except:
+                if self.gate is not None:
+                    self.gate.leave(ticket)
+                raise
+
+        self.lock.acquire()
+        try:
+            if self.started is None:
+                self.started = time.time()
+            self.requests += 1
+        finally:
+            self.lock.release()
+
+        return ticket
+
+    def release(self, ticket, overloaded=False):
+        '''Ends the request started with ``acquire``.'''
+
+        if overloaded:
+            self.lock.acquire()
+            try:
+                self.throttled += 1
+            finally:
+                self.lock.release()
+
+        if self.gate is not None:
+            self.gate.leave(ticket, overloaded)
+
+    def request_rate(self):
+        '''Returns the requests made per hour since the first one.'''
+
+        if self.started is None:
+            return 0.0
+
+        elapsed = max(time.time() - self.started, 1e-3)
+        return self.requests * 3600 / elapsed
@@ -18,11 +18,28 @@ class SimpleTokenCache(object):
     
     def __init__(self):
         self.token = None
+        self.checked = None
+
+    def get_checked(self, token):
+        '''Returns a 2-tuple of (time, perms) of when ``token`` was last
+        found valid, or None if it never was.
+        '''
+
+        if self.checked is None or self.checked[0] != token:
+            return None
+
+        return self.checked[1:]
+
+    def set_checked(self, token, perms):
+        '''Records that ``token`` was just found valid with ``perms``.'''
+
+        self.checked = (token, time.time(), perms)
 
     def forget(self):
         '''Removes the cached token'''
 
         self.token = None
+        self.checked = None
 
 class TokenCache(object):
     '''On-disk persistent token cache for a single application.
@@ -87,14 +104,53 @@ class TokenCache(object):
         f.write(token)
         f.close()
 
+    def get_checked_filename(self):
+        '''Return the full pathname of the file telling when the cached
+        token was last found valid.
+        '''
+
+        return self.get_cached_token_filename() + '.checked'
+
+    def get_checked(self, token):
+        '''Returns a 2-tuple of (time, perms) of when ``token`` was last
+        found valid, or None if it never was.
+        '''
+
+        try:
+            f = open(self.get_checked_filename(), "r")
+            checked = f.read().split()
+            f.close()
+        except IOError:
+            return None
+
+        if len(checked) != 3 or checked[0] != token:
+            return None
+
+        try:
+            return (float(checked[1]), checked[2])
+        except ValueError:
+            return None
+
+    def set_checked(self, token, perms):
+        '''Records that ``token`` was just found valid with ``perms``.'''
+
+        path = self.get_cached_token_path()
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        f = open(self.get_checked_filename(), "w")
+        f.write('%s %d %s' % (token, time.time(), perms))
+        f.close()
+
     def forget(self):
         '''Removes the cached token'''
         
         if self.username in self.memory:
             del self.memory[self.username]
-        filename = self.get_cached_token_filename()
-        if os.path.exists(filename):
-            os.unlink(filename)
+        for filename in (self.get_cached_token_filename(),
+                self.get_checked_filename()):
+            if os.path.exists(filename):
+                os.unlink(filename)
 
     token = property(get_cached_token, set_cached_token, forget, "The cached token")
 
@@ -254,6 +310,20 @@ class LockingTokenCache(TokenCache):
 
         TokenCache.set_cached_token(self, token)
 
+    @locked
+    def get_checked(self, token):
+        '''Returns a 2-tuple of (time, perms) of when ``token`` was last
+        found valid, or None if it never was.
+        '''
+
+        return TokenCache.get_checked(self, token)
+
+    @locked
+    def set_checked(self, token, perms):
+        '''Records that ``token`` was just found valid with ``perms``.'''
+
+        TokenCache.set_checked(self, token, perms)
+
     @locked
     def forget(self):
         '''Removes the cached token'''
@@ -0,0 +1,151 @@
+# -*- encoding: utf-8 -*-
+
+'''Incremental parsing of REST XML responses from Flickr.
+
+Most responses are a list element (``<photos>``, ``<contacts>``, ...)
+holding one element per record. Building the whole tree of a 500 photo
+page before looking at the first photo is wasted time and memory when
+each record is used once, so a ``StreamedResponse`` hands out the records
+as they are parsed and drops them afterwards.
+
+There is no need to use this module directly, call a FlickrAPI method
+with ``format='stream'``:
+
+>>> rsp = flickr.people_getPhotos(user_id='73509078@N00', format='stream')
+>>> pages = int(rsp.attrib['pages'])
+>>> ids = [photo.get('id') for photo in rsp]
+
+Run this module to compare its speed with the other parsers.
+'''
+
+import cStringIO
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    try:
+        import xml.etree.ElementTree as ElementTree
+    except ImportError:
+        # For Python 2.4 compatibility:
+        import elementtree.ElementTree as ElementTree
+
+from flickrapi.exceptions import FlickrError
+
+__all__ = ('StreamedResponse', )
+
+class StreamedResponse(object):
+    '''The list element of a REST response from Flickr, whose records
+    are parsed one at a time while iterating.
+
+    ``tag`` and ``attrib`` are those of the list element. Iterating
+    yields each record (a child of the list element) as an Element
+    once it is complete, including its own children. A response can
+    only be iterated once.
+
+    A failed response raises ``FlickrError`` on construction, like the
+    other parsers.
+    '''
+
+    def __init__(self, rest_xml):
+        self.events = ElementTree.iterparse(cStringIO.StringIO(rest_xml),
+                events=('start', 'end'))
+
+        # <rsp stat="...">
+        (event, rsp) = self.events.next()
+        if rsp.get('stat') != 'ok':
+            for (event, elem) in self.events:
+                if event == 'end' and elem.tag == 'err':
+                    raise FlickrError(u'Error: %(code)s: %(msg)s'
+                            % elem.attrib, elem.get('code'))
+
+            raise FlickrError(u'Error: unknown failure', 0)
+
+        # The list element; an empty response has none
+        self.element = None
+        for (event, elem) in self.events:
+            if event == 'start':
+                self.element = elem
+            break
+
+        if self.element is not None:
+            self.tag = self.element.tag
+            self.attrib = self.element.attrib
+        else:
+            self.tag = None
+            self.attrib = {}
+
+    def __iter__(self):
+        '''Yields each record of the list element.'''
+
+        if self.element is None:
+            return
+
+        depth = 0
+        for (event, elem) in self.events:
+            if event == 'start':
+                depth += 1
+                continue
+
+            # End of the list element itself
+            if depth == 0:
+                break
+
+            depth -= 1
+            if depth == 0:
+                yield elem
+
+                # Done with it, don't keep it in memory
+                self.element.remove(elem)
+
+    def get(self, key, default=None):
+        '''Returns the attribute ``key`` of the list element.'''
+
+        return self.attrib.get(key, default)
+
+if __name__ == '__main__':
+    # Benchmark the parsers on a page of 500 photos with extras
+    import timeit
+    import xml.dom.minidom
+    import xml.etree.ElementTree
+
+    import flickrapi
+
+    photo = ('<photo id="%d" owner="12345678@N00" secret="a1b2c3d4e5" '
+             'server="5123" farm="6" title="A photo &amp; its title" '
+             'ispublic="1" isfriend="0" isfamily="0" lastupdate="1300000000" '
+             'latitude="47.620835" longitude="-122.349305" accuracy="16" '
+             'media="photo" views="123" />')
+    page = ('<?xml version="1.0" encoding="utf-8" ?>\n<rsp stat="ok">'
+            '<photos page="1" pages="80" perpage="500" total="40000">%s'
+            '</photos></rsp>' % ''.join([photo % (5000000000 + i)
+                for i in xrange(500)]))
+
+    api = flickrapi.FlickrAPI('123', store_token=False, pool_size=0)
+
+    def etree():
+        return [p.get('id') for p in api.parse_etree(page).find('photos')]
+
+    def etree_py():
+        # The pure Python ElementTree that parse_etree used before
+        rsp = xml.etree.ElementTree.fromstring(page)
+        return [p.get('id') for p in rsp.find('photos')]
+
+    def xmlnode():
+        return [p['id'] for p in api.parse_xmlnode(page).photos[0].photo]
+
+    def stream():
+        return [p.get('id') for p in api.parse_stream(page)]
+
+    def minidom():
+        # Plain DOM, for reference
+        doc = xml.dom.minidom.parseString(page)
+        return [p.getAttribute('id') for p in doc.getElementsByTagName('photo')]
+
+    assert etree() == etree_py() == stream() == xmlnode() == minidom()
+
+    print 'Page of %d bytes, 500 photos' % len(page)
+    for func in (etree_py, etree, xmlnode, minidom, stream):
+        number = 50
+        best = min(timeit.repeat(func, repeat=3, number=number)) / number
+        print '%-8s %8.2f ms/page %10.0f photos/s' % (func.__name__,
+                best * 1000, 500 / best)
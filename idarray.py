@@ -0,0 +1,263 @@
+"""
+Compact lists of numeric id's.
+
+Photo id's come from Flickr as strings, and a Python string costs around 40 bytes plus a pointer in the list holding
+it.  IDArray keeps the id's as machine integers in an array instead, 8 bytes apiece, and only turns them back into
+strings as they are iterated over, which is when they are written out.  OwnedIDArray does the same for gallery
+members, which each have an owner as well.
+
+PhotoIndex is an IDArray that can also tell quickly whether it holds an id, for the id's in photos.xml.  It is saved
+next to photos.xml as a binary file that is read back with mmap instead of parsing the XML.
+
+Run this module to compare the memory used with a plain list, and loading a saved index with parsing photos.xml.
+"""
+
+import array
+import mmap
+import os
+import struct
+import sys
+
+# Flickr photo id's don't fit in 32 bits, so where a C long is that small fall back on doubles (exact up to 2**53)
+if array.array('l').itemsize >= 8:
+	TYPECODE = 'l'
+else:
+	TYPECODE = 'd'
+
+class IDArray(object):
+	"""
+	Append-only list of numeric id's that iterates as strings.
+	"""
+
+	def __init__(self, ids=[]):
+		self.ids = array.array(TYPECODE)
+
+		self.extend(ids)
+
+	def append(self, pid):
+		"""
+		Add id @pid, as a string or number, at the end.
+		"""
+
+		self.ids.append(int(pid))
+
+	def extend(self, ids):
+		"""
+		Add each of @ids in order.
+		"""
+
+		for pid in ids:
+			self.ids.append(int(pid))
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __iter__(self):
+		for pid in self.ids:
+			yield '%d' % pid
+
+	def __getitem__(self, idx):
+		return '%d' % self.ids[idx]
+
+	def __repr__(self):
+		return 'IDArray(%r)' % list(self)
+
+# Header of a saved PhotoIndex: magic, array typecode, byte order, number of id's, and the key it was saved with
+_INDEX_MAGIC = 'ASPI'
+_INDEX_HEADER = struct.Struct('<4scc2xI16s')
+
+class PhotoIndex(IDArray):
+	"""
+	IDArray with a set of the id's for membership tests, for the photo id's in photos.xml.
+	"""
+
+	def __init__(self, ids=[]):
+		self.seen = set()
+
+		IDArray.__init__(self, ids)
+
+	def append(self, pid):
+		pid = int(pid)
+
+		self.ids.append(pid)
+		self.seen.add(pid)
+
+	def extend(self, ids):
+		for pid in ids:
+			self.append(pid)
+
+	def __contains__(self, pid):
+		try:
+			return int(pid) in self.seen
+		except (TypeError, ValueError):
+			return False
+
+	def save(self, fname, key):
+		"""
+		Save the index to the file @fname, along with the 16 byte string @key that load() must be given to read it back.
+		The file is written under a temporary name and renamed, so a reader never sees half of it.
+		"""
+
+		tmp = fname + '.tmp'
+
+		f = open(tmp, 'wb')
+		f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, TYPECODE, sys.byteorder[0], len(self.ids), key))
+		self.ids.tofile(f)
+		f.close()
+
+		# Windows will not rename over an existing file
+		if os.name == 'nt' and os.path.exists(fname):
+			os.unlink(fname)
+
+		os.rename(tmp, fname)
+
+	def load(cls, fname, key):
+		"""
+		Load an index saved by save() from the file @fname.
+		Returns None if there is no such file, or it was saved with another @key, on another kind of machine, or
+		 not completely.
+		"""
+
+		try:
+			f = open(fname, 'rb')
+		except IOError:
+			return None
+
+		try:
+			size = os.fstat(f.fileno()).st_size
+			if size < _INDEX_HEADER.size:
+				return None
+
+			m = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+		finally:
+			f.close()
+
+		try:
+			magic, typecode, byteorder, cnt, savedkey = _INDEX_HEADER.unpack(m[:_INDEX_HEADER.size])
+
+			if magic != _INDEX_MAGIC or typecode != TYPECODE or byteorder != sys.byteorder[0] or savedkey != key:
+				return None
+
+			idx = cls()
+			if size != _INDEX_HEADER.size + cnt * idx.ids.itemsize:
+				return None
+
+			idx.ids.fromstring(m[_INDEX_HEADER.size:])
+		finally:
+			m.close()
+
+		idx.seen.update(idx.ids)
+		return idx
+	load = classmethod(load)
+
+class OwnedIDArray(object):
+	"""
+	Append-only list of numeric id's, each with an owner, that iterates as dictionaries of 'id' and 'owner'.
+	Each distinct owner is stored once.
+	"""
+
+	def __init__(self, things=[]):
+		self.ids = IDArray()
+
+		# Index into self.owners for each id
+		self.owner_idx = array.array('i')
+
+		# Distinct owners in the order first seen, and their index
+		self.owners = []
+		self._owners = {}
+
+		self.extend(things)
+
+	def append(self, pid, owner):
+		"""
+		Add id @pid owned by @owner at the end.
+		"""
+
+		idx = self._owners.get(owner)
+		if idx == None:
+			idx = len(self.owners)
+			self._owners[owner] = idx
+			self.owners.append(owner)
+
+		self.ids.append(pid)
+		self.owner_idx.append(idx)
+
+	def extend(self, things):
+		"""
+		Add each of @things, dictionaries of 'id' and 'owner', in order.
+		"""
+
+		for thing in things:
+			self.append(thing['id'], thing['owner'])
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __iter__(self):
+		for pid,idx in zip(self.ids, self.owner_idx):
+			yield {'id': pid, 'owner': self.owners[idx]}
+
+	def __repr__(self):
+		return 'OwnedIDArray(%r)' % list(self)
+
+
+if __name__ == "__main__":
+	# The photo id's of a large set, as they come from Flickr
+	pids = [str(5000000000 + i * 37) for i in xrange(100000)]
+
+	def listsize(l):
+		return sys.getsizeof(l) + sum([sys.getsizeof(z) for z in l])
+
+	ids = IDArray(pids)
+
+	assert list(ids) == pids
+
+	print '%d id\'s' % len(pids)
+	print '%-12s %10.2f MB' % ('list', listsize(pids) / 1048576.0)
+	print '%-12s %10.2f MB' % ('IDArray', sys.getsizeof(ids.ids) / 1048576.0)
+
+	# Loading the id's of photos.xml by parsing it against reading a saved PhotoIndex
+	import tempfile
+	import timeit
+	from xml.sax import make_parser, handler
+
+	d = tempfile.mkdtemp()
+	xname = os.path.join(d, 'photos.xml')
+	iname = os.path.join(d, 'photos.idx')
+
+	f = open(xname, 'w')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n<asofa>\n\t<photos>\n')
+	for pid in pids:
+		f.write('\t\t<photo id="%s" />\n' % pid)
+	f.write('\t</photos>\n</asofa>\n')
+	f.close()
+
+	PhotoIndex(pids).save(iname, 'k' * 16)
+
+	class Reader(handler.ContentHandler):
+		def __init__(self):
+			self.pids = []
+
+		def startElement(self, name, attrs):
+			if name == 'photo':
+				self.pids.append(attrs['id'])
+
+	def parse():
+		p = make_parser()
+		r = Reader()
+		p.setContentHandler(r)
+		p.parse(xname)
+		return r.pids
+
+	def load():
+		return PhotoIndex.load(iname, 'k' * 16)
+
+	assert list(load()) == parse()
+
+	for func in (parse, load):
+		best = min(timeit.repeat(func, repeat=3, number=1))
+		print '%-12s %10.2f ms' % (func.__name__, best * 1000)
+
+	os.unlink(xname)
+	os.unlink(iname)
+	os.rmdir(d)
@@ -0,0 +1,87 @@
+"""
+Ordered set for accumulating id's without duplicates.
+
+Checking `if x not in somelist` before appending is linear in the length of the list, which adds up quickly
+when collecting tens of thousands of photo id's.  OrderedSet keeps a set next to the list so membership is
+constant time while iteration stays in the order id's were first added.
+
+Run this module to compare it with a plain list.
+"""
+
+class OrderedSet(object):
+	"""
+	Set that remembers the order its items were first added in.
+	"""
+
+	def __init__(self, items=[]):
+		self.items = []
+		self.seen = set()
+
+		self.update(items)
+
+	def add(self, item):
+		"""
+		Add @item at the end unless it is already present.
+		Returns True if it was added.
+		"""
+
+		if item in self.seen:
+			return False
+
+		self.seen.add(item)
+		self.items.append(item)
+		return True
+
+	def update(self, items):
+		"""
+		Add each of @items in order.
+		"""
+
+		for item in items:
+			if item not in self.seen:
+				self.seen.add(item)
+				self.items.append(item)
+
+	def __contains__(self, item):
+		return item in self.seen
+
+	def __iter__(self):
+		return iter(self.items)
+
+	def __len__(self):
+		return len(self.items)
+
+	def __getitem__(self, idx):
+		return self.items[idx]
+
+	def __repr__(self):
+		return 'OrderedSet(%r)' % self.items
+
+
+if __name__ == "__main__":
+	# Accumulate id's the way the stats date range does: pages of 100, a third of them seen before
+	import timeit
+
+	pages = []
+	for pg in xrange(300):
+		pages.append([str(5000000000 + (pg * 67 + i) % 20000) for i in xrange(100)])
+
+	def plainlist():
+		pids = []
+		for page in pages:
+			pids += [pid for pid in page if pid not in pids]
+		return pids
+
+	def orderedset():
+		pids = OrderedSet()
+		for page in pages:
+			pids.update(page)
+		return pids
+
+	assert plainlist() == list(orderedset())
+
+	print '%d pages, %d unique id\'s' % (len(pages), len(orderedset()))
+	for func in (plainlist, orderedset):
+		number = 1
+		best = min(timeit.repeat(func, repeat=3, number=number)) / number
+		print '%-12s %10.2f ms' % (func.__name__, best * 1000)
@@ -6,14 +6,108 @@ Aerodynamic Sofa by Colin ML Burnett
 DEFAULT_CONFIG_NAME = '.aerodynamicsofa.config'
 VERSION = (1,0,0)
 
+# Tuning knobs; the defaults here are overridden by the [Tuning] section of the config file and then by the command line
+TUNING = {
+	# Number of photos synchronized concurrently (-j)
+	'jobs': 1,
+
+	# Issue the independent API calls for a single photo concurrently (--no-fanout turns off)
+	'fanout': True,
+
+	# Number of XML files written before they are all synced to disk at once, 0 syncs every file as it is written
+	'fsync_batch': 0,
+
+	# Keep Flickr's responses in cache.db in the storage directory (--cache), up to cache_size MB, otherwise the last
+	# MEMORY_CACHE_ENTRIES of them in memory for the run
+	# Responses are kept for cache_timeout seconds unless CACHE_TIMEOUTS says otherwise
+	'cache': False,
+	'cache_size': 256,
+	'cache_timeout': 3 * 3600,
+
+	# Place this many or more new photo id's from the photo listing rather than a getContext walk per photo, 0 never does
+	'merge_listing': 20,
+
+	# Number of days fetched concurrently when syncing popular photos for a date range (-d)
+	'date_jobs': 4,
+
+	# Number of collections whose information, or sets whose photos, are fetched concurrently
+	'list_jobs': 4,
+
+	# Most requests made per hour, 0 is no limit (Flickr allows 3600 per hour per key)
+	'rate': 0,
+
+	# Most times a call is made when it fails for a passing reason (network errors, Flickr being unavailable)
+	'retries': 5,
+
+	# Number of pages of a listing fetched ahead while the earlier pages are processed
+	'prefetch': 4,
+
+	# Skip the photos whose last update on Flickr is the one recorded in their XML file when they were last synced
+	'skip_unchanged': False,
+
+	# Seconds a login token found valid is trusted before asking Flickr about it again, 0 asks every time
+	'token_check': 86400,
+
+	# Seconds after which the journal of an interrupted sync is too old to resume from, 0 resumes however old
+	'journal_age': 86400,
+}
+
+# Seconds that responses of particular Flickr methods are cached for instead of TUNING['cache_timeout'], 0 is never
+CACHE_TIMEOUTS = {
+	# EXIF does not change once uploaded
+	'flickr.photos.getExif': 30 * 86400,
+
+	# These change often enough that a stale copy would make for a wrong backup
+	'flickr.photos.getFavorites': 600,
+	'flickr.photos.comments.getList': 600,
+	'flickr.stats.getPopularPhotos': 600,
+	'flickr.photos.recentlyUpdated': 0,
+
+	'flickr.auth.checkToken': 0,
+	'flickr.auth.getFrob': 0,
+	'flickr.auth.getToken': 0,
+}
+
+# Number of responses kept in memory for the run when they are not kept in cache.db
+MEMORY_CACHE_ENTRIES = 1000
+
+# Records per page requested from the paged Flickr methods, the most each allows unless overridden by the
+# [Tuning] section of the config file with perpage.METHOD (eg, perpage.people.getPhotos: 100)
+PERPAGE = {
+	'flickr.contacts.getList': 1000,
+	'flickr.favorites.getList': 500,
+	'flickr.galleries.getList': 500,
+	'flickr.galleries.getListForPhoto': 500,
+	'flickr.galleries.getPhotos': 500,
+	'flickr.people.getPhotos': 500,
+	'flickr.photos.getFavorites': 50,
+	'flickr.photos.recentlyUpdated': 500,
+	'flickr.photosets.getPhotos': 500,
+	'flickr.stats.getPopularPhotos': 100,
+}
+
+# Extra fields asked of the photo listings, so fsync_photo() can leave out the calls whose answer is already known
+LISTING_EXTRAS = 'last_update,geo,count_faves,count_comments'
+
 
 # Gets us flickr API access
 import flickrapi
 
 # Utility stuff
 import datetime, time
+import errno
 import os, os.path
 import sys
+import cStringIO
+import json
+import hashlib
+from orderedset import OrderedSet
+from idarray import IDArray, OwnedIDArray, PhotoIndex
+
+# Worker threads
+import threading
+import Queue
+import collections
 
 # Config follows the RFC 822
 import ConfigParser
@@ -51,26 +145,103 @@ def main(args):
 	recurse = kargs['recurse']
 	resume = kargs['resume']
 	date = kargs['date']
+	incremental = kargs['incremental']
 	ids = kargs['args']
 
+	# Photos that failed last time are synced as if their ID's were provided
+	if kargs['retry_failed']:
+		ids = _get_failed(sdir).keys()
+
+		if not len(ids):
+			print 'No failed photos listed in %sfailed.xml' % sdir
+			return 0
+
+	TUNING['jobs'] = kargs['jobs']
+	TUNING['fanout'] = kargs['fanout']
+	TUNING['fsync_batch'] = kargs['fsync_batch']
+	TUNING['cache'] = kargs['cache']
+	TUNING['cache_size'] = kargs['cache_size']
+	TUNING['cache_timeout'] = kargs['cache_timeout']
+	TUNING['merge_listing'] = kargs['merge_listing']
+	TUNING['date_jobs'] = kargs['date_jobs']
+	TUNING['list_jobs'] = kargs['list_jobs']
+	TUNING['rate'] = kargs['rate']
+	TUNING['retries'] = kargs['retries']
+	TUNING['prefetch'] = kargs['prefetch']
+	TUNING['skip_unchanged'] = kargs['skip_unchanged']
+	TUNING['token_check'] = kargs['token_check']
+	TUNING['journal_age'] = kargs['journal_age']
+	PERPAGE.update(kargs['perpage'])
+
+
+	# Keep a connection open for every call that can be in flight at once
+	conns = TUNING['jobs']
+	if TUNING['fanout']: conns *= 6
+	conns = max(conns, TUNING['prefetch'], TUNING['list_jobs'])
 
 	# Pass in keys and authenticate
-	f = Flickr(ak, sk)
+	f = Flickr(ak, sk, conns)
+	f.FlickrAPI.token_check_interval = TUNING['token_check']
 	f.Authenticate()
 
+	# Pace the requests, and have fewer in flight when Flickr is overloaded
+	f.FlickrAPI.throttle = flickrapi.throttle.Throttle(TUNING['rate'], conns)
+
+	# Retry calls that fail for a passing reason, backing off between tries
+	f.FlickrAPI.retry = flickrapi.retry.RetryPolicy(TUNING['retries'])
+
+	if TUNING['cache']:
+		_mkdir(sdir)
+		f.FlickrAPI.cache = flickrapi.cache.DiskCache(sdir + 'cache.db', TUNING['cache_timeout'], TUNING['cache_size'] << 20, CACHE_TIMEOUTS)
+	else:
+		# Striped so that the threads making calls don't wait on each other
+		f.FlickrAPI.cache = flickrapi.cache.LRUCache(TUNING['cache_timeout'], MEMORY_CACHE_ENTRIES, conns, CACHE_TIMEOUTS)
+
 	# Get user's ID
 	u = f.GetUser(nsid=uid)
 
 	# Do the sync-y!
 	# Sync whatever the user requested
-	if 't' in limit:	fsync_contacts(sdir, u, quiet)
-	if 'f' in limit:	fsync_favorites(sdir, u, quiet)
-	if 'r' in limit:	fsync_groups(sdir, u, quiet)
-	if 'c' in limit:	fsync_collections(sdir, u, quiet, ids, recurse)
-	if 's' in limit:	fsync_sets(sdir, u, quiet, ids, recurse)
-	if 'g' in limit:	fsync_galleries(sdir, u, quiet)
-	if 'p' in limit:	fsync_photos(sdir, u, quiet, ids, resume, date)
-	if 'o' in limit:	fsync_profile(sdir, u, quiet)
+	try:
+		if 't' in limit:	fsync_contacts(sdir, u, quiet)
+		if 'f' in limit:	fsync_favorites(sdir, u, quiet)
+		if 'r' in limit:	fsync_groups(sdir, u, quiet)
+		if 'c' in limit:	fsync_collections(sdir, u, quiet, ids, recurse)
+		if 's' in limit:	fsync_sets(sdir, u, quiet, ids, recurse)
+		if 'g' in limit:	fsync_galleries(sdir, u, quiet)
+		if 'p' in limit:	fsync_photos(sdir, u, quiet, ids, resume, date, incremental)
+		if 'o' in limit:	fsync_profile(sdir, u, quiet)
+
+	finally:
+		# Files completed before a failure or Ctrl-C are still kept
+		flushxml()
+
+	if not quiet: summary(f)
+
+def summary(f):
+	"""
+	Print statistics about the sync just done through Flickr object @f.
+	"""
+
+	pool = f.FlickrAPI.http_pool
+	if pool != None:
+		print 'Connections: %d opened, %d reused' % (pool.opened, pool.reused)
+
+	throttle = f.FlickrAPI.throttle
+	if throttle != None:
+		print 'Requests: %d at %.0f per hour' % (throttle.requests, throttle.request_rate())
+
+		if throttle.throttled:
+			print 'Flickr overloaded: %d times, concurrency lowered to %d' % (throttle.throttled, throttle.gate.lowest)
+
+	print 'Files: %d written, %d unchanged' % (STATS['written'], STATS['unchanged'])
+
+	if STATS['failed']:
+		print 'Failed: %d photos, listed in failed.xml to sync again with --retry-failed' % STATS['failed']
+
+	cache = f.FlickrAPI.cache
+	if cache != None:
+		print 'Cache: %d hits, %d misses' % (cache.hits, cache.misses)
 
 def parseopts(args):
 	"""
@@ -78,7 +249,7 @@ def parseopts(args):
 	"""
 
 	# Parse out options
-	lopts, args = getopt.getopt(args, 'c:d:e:hl:qr', ['accesskey=', 'secretkey=', 'uid='])
+	lopts, args = getopt.getopt(args, 'c:d:e:hij:l:qr', ['accesskey=', 'secretkey=', 'uid=', 'no-fanout', 'cache', 'retry-failed'])
 
 	# Map options to dictionary (yes, over-writing repeats)
 	dopts = {}
@@ -105,6 +276,14 @@ Options:
  --accesskey  The Flickr API access key
  --secretkey  The Flickr API secret key
  --uid        The Flickr user ID
+ --no-fanout  Request the metadata of a photo one call at a time instead of
+              issuing the independent calls concurrently
+ --cache      Keep Flickr's responses in cache.db in the storage directory so
+              that restarting an interrupted sync does not fetch them again
+ --retry-failed
+              Sync again the photos listed in failed.xml in the storage
+              directory.  Photos that still fail to sync after retrying
+              are listed there and the sync carries on.  Requires `-l p`.
   -l OPTS     Limit the sync (any order of characters):
                c    Collections
                f    Favorites
@@ -127,7 +306,15 @@ Options:
               You will need to quote this argument since the pipe will be
               intercepted by the shell.  Single quotes are sufficient.
               You may not specific ID\'s with a date.
-  -e ID       Resume from the given ID
+  -e ID       Resume from the given photo ID.  This is rarely needed: the
+              photos, sets, galleries and collections done so far are kept in
+              journal files in the storage directory, and an interrupted sync
+              run again with the same options skips them by itself.
+  -i          Incremental: sync only the photos updated since the last full or
+              incremental photo sync, as recorded in lastsync.xml in the
+              storage directory.  Without a record all photos are synced.
+              Photos deleted from Flickr are not removed by an incremental sync.
+  -j N        Synchronize N photos concurrently (default: 1)
   [ID ID...]  Any number of ID\'s may be supplied that are specifically synced
               Collections, Photos, and Sets accept ID\'s and these options are then
               in the -l OPTS list to avoid ambiguity in what the ID\'s belong.
@@ -146,7 +333,70 @@ secretkey: XXXXXXXXXXXXXXXX
 uid: XXXXXXXXXXXX
 
 [Storage]
-dir: ./flickr/"""
+dir: ./flickr/
+
+[Tuning]
+jobs: 1
+fanout: yes
+fsync_batch: 0
+cache: no
+cache_size: 256
+cache_timeout: 10800
+merge_listing: 20
+date_jobs: 4
+list_jobs: 4
+rate: 0
+retries: 5
+prefetch: 4
+skip_unchanged: no
+token_check: 86400
+journal_age: 86400
+perpage.people.getPhotos: 500
+
+Every XML file is written to a temporary file that is synced to disk and then
+renamed over the old file.  With fsync_batch set to N, files are instead synced
+and renamed in batches of N, which is much faster for the photos but a crash
+loses up to the last N files written (the previous versions remain intact).
+
+The response cache holds up to cache_size MB, dropping the least recently used
+responses first.  Without --cache the last 1000 responses are kept in memory
+for the run instead.  Responses expire after cache_timeout seconds, except EXIF
+which is kept for 30 days and favorites and comments which are kept for 10
+minutes.
+
+Photos synced by ID are put in their place in photos.xml by asking Flickr for
+the photo before each one.  When merge_listing or more photos are new, their
+places are taken from the listing of all photos instead, which needs one call
+per 500 photos.
+
+With -d, up to date_jobs days are fetched at once.
+
+The information of up to list_jobs collections, or the photos in up to
+list_jobs sets, is fetched at once.
+
+Flickr allows 3600 requests per hour for each API key.  Setting rate keeps
+the requests under that many per hour (0 is no limit).  Whatever the rate,
+fewer requests are made at once while Flickr answers that it is overloaded.
+
+A request that fails because of the network or because Flickr is unavailable
+is made up to retries times in all, waiting longer before each try.
+
+Listings that span several pages, like all of the photos, fetch up to prefetch
+pages at once.  Each page is as large as Flickr allows for that listing unless
+set with perpage.METHOD, where METHOD is the Flickr method name without its
+"flickr." prefix, for example perpage.people.getPhotos.
+
+With skip_unchanged, photos whose last update on Flickr has not changed since
+they were synced are left out when syncing all photos, the photos of sets with
+-r, or with -i.  Views and favorites don't count as an update, so these may be
+out of date in the skipped photos.
+
+The login token is only checked with Flickr when it was last found valid more
+than token_check seconds ago (0 checks it on every run).
+
+An interrupted sync is only resumed from its journal when the journal was
+started less than journal_age seconds ago (0 resumes however long ago), since
+the sets and photos it recorded may have changed on Flickr since."""
 		return 0
 
 	# Define variables up front to know when they've been set
@@ -159,6 +409,23 @@ dir: ./flickr/"""
 	date = None
 	recurse = None
 	resume = None
+	incremental = None
+	jobs = TUNING['jobs']
+	fanout = TUNING['fanout']
+	fsync_batch = TUNING['fsync_batch']
+	cache = TUNING['cache']
+	cache_size = TUNING['cache_size']
+	cache_timeout = TUNING['cache_timeout']
+	merge_listing = TUNING['merge_listing']
+	date_jobs = TUNING['date_jobs']
+	list_jobs = TUNING['list_jobs']
+	rate = TUNING['rate']
+	retries = TUNING['retries']
+	prefetch = TUNING['prefetch']
+	skip_unchanged = TUNING['skip_unchanged']
+	token_check = TUNING['token_check']
+	journal_age = TUNING['journal_age']
+	perpage = {}
 
 	# Path to config file
 	cfgpath = None
@@ -208,14 +475,45 @@ dir: ./flickr/"""
 		if cfg.has_section('Storage'):
 			if cfg.has_option('Storage', 'dir'):			sdir = cfg.get('Storage', 'dir')
 
+		if cfg.has_section('Tuning'):
+			if cfg.has_option('Tuning', 'jobs'):			jobs = cfg.get('Tuning', 'jobs')
+			if cfg.has_option('Tuning', 'fanout'):			fanout = cfg.getboolean('Tuning', 'fanout')
+			if cfg.has_option('Tuning', 'fsync_batch'):		fsync_batch = cfg.get('Tuning', 'fsync_batch')
+			if cfg.has_option('Tuning', 'cache'):			cache = cfg.getboolean('Tuning', 'cache')
+			if cfg.has_option('Tuning', 'cache_size'):		cache_size = cfg.get('Tuning', 'cache_size')
+			if cfg.has_option('Tuning', 'cache_timeout'):	cache_timeout = cfg.get('Tuning', 'cache_timeout')
+			if cfg.has_option('Tuning', 'merge_listing'):	merge_listing = cfg.get('Tuning', 'merge_listing')
+			if cfg.has_option('Tuning', 'date_jobs'):		date_jobs = cfg.get('Tuning', 'date_jobs')
+			if cfg.has_option('Tuning', 'list_jobs'):		list_jobs = cfg.get('Tuning', 'list_jobs')
+			if cfg.has_option('Tuning', 'rate'):			rate = cfg.get('Tuning', 'rate')
+			if cfg.has_option('Tuning', 'retries'):			retries = cfg.get('Tuning', 'retries')
+			if cfg.has_option('Tuning', 'prefetch'):		prefetch = cfg.get('Tuning', 'prefetch')
+			if cfg.has_option('Tuning', 'skip_unchanged'):	skip_unchanged = cfg.getboolean('Tuning', 'skip_unchanged')
+			if cfg.has_option('Tuning', 'token_check'):		token_check = cfg.get('Tuning', 'token_check')
+			if cfg.has_option('Tuning', 'journal_age'):		journal_age = cfg.get('Tuning', 'journal_age')
+
+			# Option names come back lower cased
+			for opt in cfg.options('Tuning'):
+				if opt.startswith('perpage.'):
+					perpage[opt[len('perpage.'):]] = cfg.get('Tuning', opt)
+
 	# Explicit options override the config
 	if '--accesskey' in dopts:	ak = dopts['--accesskey']
 	if '--secretkey' in dopts:	sk = dopts['--secretkey']
 	if '--uid' in dopts:		uid = dopts['--uid']
+	if '-j' in dopts:			jobs = dopts['-j']
+	if '--no-fanout' in dopts:	fanout = False
+	if '--cache' in dopts:		cache = True
+
+	# Check for retrying the failed photos
+	retry_failed = '--retry-failed' in dopts
 
 	# Check for recursion
 	recurse = '-r' in dopts
 
+	# Check for incremental
+	incremental = '-i' in dopts
+
 	# Make it a list of chars
 	if '-l' in dopts:
 		limit = dopts['-l']
@@ -234,6 +532,29 @@ dir: ./flickr/"""
 
 	# Check that options are present
 	fails = []
+	jobs = _intopt('Number of jobs', jobs, 1, fails)
+	fsync_batch = _intopt('fsync_batch', fsync_batch, 0, fails)
+	cache_size = _intopt('cache_size', cache_size, 1, fails)
+	cache_timeout = _intopt('cache_timeout', cache_timeout, 0, fails)
+	merge_listing = _intopt('merge_listing', merge_listing, 0, fails)
+	date_jobs = _intopt('date_jobs', date_jobs, 1, fails)
+	list_jobs = _intopt('list_jobs', list_jobs, 1, fails)
+	rate = _intopt('rate', rate, 0, fails)
+	retries = _intopt('retries', retries, 1, fails)
+	prefetch = _intopt('prefetch', prefetch, 1, fails)
+	token_check = _intopt('token_check', token_check, 0, fails)
+	journal_age = _intopt('journal_age', journal_age, 0, fails)
+
+	# Match the page sizes to the methods in PERPAGE
+	methods = dict([(m.lower(), m) for m in PERPAGE])
+	for name,val in perpage.items():
+		del perpage[name]
+
+		if 'flickr.' + name not in methods:
+			fails.append('perpage.%s is not a paged method, one of: %s' % (name, ', '.join(sorted([m[len('flickr.'):] for m in PERPAGE]))))
+			continue
+
+		perpage[methods['flickr.' + name]] = _intopt('perpage.' + name, val, 1, fails)
 	if ak == None:					fails.append('API access key not provided in options or in config file')
 	if sk == None:					fails.append('API secret key not provided in options or in config file')
 	if uid == None:					fails.append('Flickr user ID not provided in options or in config file')
@@ -264,6 +585,17 @@ dir: ./flickr/"""
 		if 's' in limit:			fails.append('Cannot resume on sets')
 		if 't' in limit:			fails.append('Cannot resume on contacts')
 		if 'o' in limit:			fails.append('Cannot resume on profile')
+	if incremental:
+		if 'p' not in limit:		fails.append('Incremental sync requires photos in the limit list')
+		if len(args):				fails.append('Incremental sync cannot accompany a list of ID\'s')
+		if date != None:			fails.append('Incremental sync cannot accompany a date')
+		if resume:					fails.append('Incremental sync cannot be resumed')
+	if retry_failed:
+		if limit != set(['p']):		fails.append('Retrying failed photos requires `-l p`')
+		if len(args):				fails.append('Retrying failed photos cannot accompany a list of ID\'s')
+		if date != None:			fails.append('Retrying failed photos cannot accompany a date')
+		if resume:					fails.append('Retrying failed photos cannot be resumed')
+		if incremental:				fails.append('Retrying failed photos cannot be incremental')
 
 	# Trailing slash
 	if sdir and sdir[-1] != '/':
@@ -281,7 +613,25 @@ dir: ./flickr/"""
 	if sdir[0] == '.':
 		sdir = os.getcwd() + sdir[1:]
 
-	return {'accesskey': ak, 'secretkey': sk, 'uid': uid, 'quiet': quiet, 'dir': sdir, 'limit': limit, 'recurse': recurse, 'date': date, 'resume': resume, 'args': args}
+	return {'accesskey': ak, 'secretkey': sk, 'uid': uid, 'quiet': quiet, 'dir': sdir, 'limit': limit, 'recurse': recurse, 'date': date, 'incremental': incremental, 'retry_failed': retry_failed, 'resume': resume, 'jobs': jobs, 'fanout': fanout, 'fsync_batch': fsync_batch, 'cache': cache, 'cache_size': cache_size, 'cache_timeout': cache_timeout, 'merge_listing': merge_listing, 'date_jobs': date_jobs, 'list_jobs': list_jobs, 'rate': rate, 'retries': retries, 'prefetch': prefetch, 'skip_unchanged': skip_unchanged, 'token_check': token_check, 'journal_age': journal_age, 'perpage': perpage, 'args': args}
+
+
+def _intopt(name, val, least, fails):
+	"""
+	Returns option @val as an int.
+	If it is not a number or is less than @least then a message naming option @name is appended to @fails.
+	"""
+
+	try:
+		val = int(val)
+	except ValueError:
+		fails.append('%s must be a number: %s' % (name, val))
+		return None
+
+	if val < least:
+		fails.append('%s must be at least %d' % (name, least))
+
+	return val
 
 
 #------------------------------------------------------------------------------
@@ -312,350 +662,985 @@ def index(seq, f):
 
 	return -1
 
-def _openxml(sdir, name):
+# Serializes output from worker threads so lines do not interleave
+_saylock = threading.Lock()
+
+def say(msg):
 	"""
-	Checks that @sdir exists and if @name exists in @sdir then it is deleted.
-	Returns a write-only file object to @name.
+	Prints @msg on its own line, safe to call from worker threads.
 	"""
 
-	# Make sure directory exists
-	if not os.path.exists(sdir):
-		os.mkdir(sdir)
-
-	# Check that file doesn't exist
-	fname = sdir + name
-	if os.path.exists(fname):
-		os.unlink(fname)
-
-	# Open output XML file
-	return open(fname, 'w')
-
-#------------------------------------------------------------------------------
-#------------------------------------------------------------------------------
-# XML reader classes
-#------------------------------------------------------------------------------
-#------------------------------------------------------------------------------
+	_saylock.acquire()
+	try:
+		print msg
+	finally:
+		_saylock.release()
 
-class SetsXMLReader(handler.ContentHandler):
+def _mkdir(path):
 	"""
-	XML reader for the sets.xml
+	Creates the directory @path if it does not exist.
+	Another thread creating it first is not an error.
 	"""
 
-	def __init__(self):
-		# Current set id for when a <photo> is encountered
-		self._sid = None
+	try:
+		os.mkdir(path)
+	except OSError, e:
+		if e.errno != errno.EEXIST:
+			raise
 
-		# Dictionary keyed on set id to a dictionary of id, title, description, primary, and a list of things (photo or video id)
-		self.sets = {}
+# Counters reported at the end of the run, keyed by what is counted
+STATS = collections.defaultdict(int)
+_statslock = threading.Lock()
 
-		# List of set id's as presented in the file
-		self.sids = []
+def count(key, n=1):
+	"""
+	Adds @n to the counter @key in STATS, safe to call from worker threads.
+	"""
 
-	def startElement(self, name, attrs):
-		"""
-		Catches starts of <photo> and <set> and populates self.sets and self.sids appropriately.
-		"""
+	_statslock.acquire()
+	try:
+		STATS[key] += n
+	finally:
+		_statslock.release()
 
-		if name == 'set':
-			# Unescape everything
-			sid = xml.sax.saxutils.unescape(attrs['id'])
-			t = xml.sax.saxutils.unescape(attrs['title'])
-			d = xml.sax.saxutils.unescape(attrs['description'])
-			prim = xml.sax.saxutils.unescape(attrs['primary'])
+class XMLFile:
+	"""
+	Write-only file object that collects an XML file in memory.
+	The file on disk is replaced on close() only if the content differs, so unchanged files keep
+	their modification time and do not show up as changes in snapshots or history of the storage directory.
+	"""
 
-			# Set current set id and add to list
-			self._sid = sid
-			self.sids.append(sid)
+	def __init__(self, fname):
+		self.name = fname
+		self._buf = cStringIO.StringIO()
 
-			# Create data dictionary and populate
-			self.sets[sid] = {}
-			self.sets[sid]['id'] = sid
-			self.sets[sid]['title'] = t.encode('utf-8')
-			self.sets[sid]['description'] = d.encode('utf-8').replace('<br />', '\n')
-			self.sets[sid]['primary'] = prim
-			self.sets[sid]['things'] = []
+	def write(self, s):
+		self._buf.write(s)
 
-		elif name == 'photo':
-			pid = attrs['id']
-			self.sets[self._sid]['things'].append(pid)
+	def close(self):
+		_savexml(self.name, self._buf.getvalue())
+		self._buf.close()
 
-class PhotosXMLReader(handler.ContentHandler):
+def _savexml(fname, data):
 	"""
-	XML reader for the photos.xml
+	Writes @data to the file @fname unless it already holds exactly @data.
+	Returns True if the file was written.
 	"""
 
-	def __init__(self):
-		# List of photo id's as presented in the file
-		self.pids = []
+	# Compare against and replace what was last written to @fname, not a version still held back in the batch
+	_landxml(fname)
 
-	def startElement(self, name, attrs):
-		"""
-		Catches starts of <photo> and populates self.pids appropriately.
-		"""
+	# A different size is enough to know it changed without reading the file
+	try:
+		if os.path.getsize(fname) == len(data):
+			f = open(fname, 'r')
+			old = f.read()
+			f.close()
 
-		if name == 'photo':
-			pid = xml.sax.saxutils.unescape(attrs['id'])
+			if old == data:
+				count('unchanged')
+				return False
 
-			# add to list
-			self.pids.append(pid)
+	except OSError, e:
+		if e.errno != errno.ENOENT:
+			raise
 
-#------------------------------------------------------------------------------
-#------------------------------------------------------------------------------
-# Sync routines
-#------------------------------------------------------------------------------
-#------------------------------------------------------------------------------
+	# Write everything to a temp file next to @fname and rename it over @fname once it is on disk
+	# A crash or Ctrl-C then leaves either the old or the new file but never a missing or truncated one
+	tmp = fname + '.tmp'
 
-def fsync_contacts(sdir, u, quiet):
-	"""
-	Sync all the contacts.
-	"""
+	f = open(tmp, 'w')
+	f.write(data)
+	f.flush()
 
-	if not quiet: print 'Syncing contacts (t)...'
+	if TUNING['fsync_batch'] > 0:
+		f.close()
 
-	# Pull down contacts from Flickr and write to file
-	contacts = _get_contacts(u.Flickr.FlickrAPI, quiet)
-	_put_contacts(contacts, sdir)
+		_pendinglock.acquire()
+		try:
+			_pending[fname] = tmp
 
+			if len(_pending) >= TUNING['fsync_batch']:
+				_flushxml()
+		finally:
+			_pendinglock.release()
 
-def _get_contacts(api, quiet):
-	# Accumulate contacts here and key by nsid
-	contacts = {}
+	else:
+		os.fsync(f.fileno())
+		f.close()
 
-	# Multiple pages
-	pg = 1
-	pages = 1
-	perpage = 50
+		_rename(tmp, fname)
+		_syncdirs([fname])
 
-	while pg <= pages:
-		ret = api.contacts_getList(per_page=perpage, page=pg)
-		cntcts = ret.find('contacts')
-		pages = int(cntcts.attrib['pages'])
+	count('written')
+	return True
 
-		for cntct in cntcts.findall('contact'):
-			nsid = cntct.attrib['nsid']
-			user = cntct.attrib['username']
-			name = cntct.attrib['realname']
-			fam = bool(int(cntct.attrib['family']))
-			fri = bool(int(cntct.attrib['friend']))
-			ign = bool(int(cntct.attrib['ignored']))
+# Temp files written but not yet renamed into place when fsyncs are batched, name -> temp name
+_pending = collections.OrderedDict()
+_pendinglock = threading.RLock()
 
-			contacts[nsid] = {'nsid': nsid, 'name': name, 'username': user, 'family': fam, 'friend': fri, 'ignored': ign}
+def flushxml():
+	"""
+	Syncs to disk the XML files held back by TUNING['fsync_batch'] and renames them into place.
+	"""
 
-			if not quiet:
-				print "%s as %s (%s): family=%s, friend=%s, ignored=%s" % (name, user, nsid, fam, fri, ign)
+	_pendinglock.acquire()
+	try:
+		_flushxml()
+	finally:
+		_pendinglock.release()
 
-		# Next page please
-		pg += 1
+def _flushxml():
+	"""
+	flushxml() with _pendinglock already held.
+	"""
 
-	return contacts
+	if not len(_pending):
+		return
 
-def _put_contacts(contacts, sdir):
-	f = _openxml(sdir, 'contacts.xml')
-	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-	f.write('<asofa>\n')
-	f.write('\t<contacts>\n')
+	_syncall(_pending.values())
 
-	# Write contacts in order by nsid
-	keys = contacts.keys()
-	keys.sort()
-	for key in keys:
-		c = contacts[key]
+	for fname,tmp in _pending.items():
+		_rename(tmp, fname)
 
-		f.write('\t\t<contact nsid="%s" realname="%s" username="%s" family="%d" friend="%d" ignored="%d" />\n' % (c['nsid'], c['name'], c['username'], int(c['family']), int(c['friend']), int(c['ignored'])))
+	_syncdirs(_pending.keys())
 
-	f.write('\t</contacts>\n')
-	f.write('</asofa>\n')
-	f.close()
+	_pending.clear()
 
+	# The work held back in the journals is on disk now
+	for j in _journals:
+		j._commit()
 
-def fsync_favorites(sdir, u, quiet):
+def _landxml(fname):
 	"""
-	Sync all the favorites.
-	These are the favorites by the user, not photos by the user that have been favorited by others.
+	Flushes the batch of XML files held back by TUNING['fsync_batch'] if @fname is in it, so that the file @fname on
+	 disk is the one last written and can be read, replaced or removed.
 	"""
 
-	if not quiet: print 'Syncing favorites (f)...'
-
-	# Pull down favorites from Flickr and write to file
-	favs = _get_favorites(u.Flickr.FlickrAPI, quiet)
-	_put_favorites(favs, sdir)
+	_pendinglock.acquire()
+	try:
+		if fname in _pending:
+			_flushxml()
+	finally:
+		_pendinglock.release()
 
-def _get_favorites(api, quiet):
-	# Accumulate favorites here and key by photo id
-	favorites = {}
+def _syncall(fnames):
+	"""
+	Gets the files @fnames onto disk.
+	"""
 
-	# Multiple pages
-	pg = 1
-	pages = 1
-	perpage = 50
+	for fname in fnames:
+		fd = os.open(fname, os.O_RDWR)
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
 
-	while pg <= pages:
-		ret = api.favorites_getList(per_page=perpage, page=pg)
-		photos = ret.find('photos')
-		pages = int(photos.attrib['pages'])
+def _syncdirs(fnames):
+	"""
+	Gets onto disk the directories holding the files @fnames, so that files renamed into them stay renamed.
+	"""
 
-		for pht in photos.findall('photo'):
-			psid = pht.attrib['id']
-			nsid = pht.attrib['owner']
-			t = pht.attrib['title'].encode('utf-8')
+	# Only POSIX lets a directory be opened and fsync'ed
+	if os.name != 'posix':
+		return
 
-			favorites[psid] = {'psid': psid, 'owner': nsid, 'title': t}
+	for d in set([os.path.dirname(os.path.abspath(fname)) for fname in fnames]):
+		fd = os.open(d, os.O_RDONLY)
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
 
-			if not quiet:
-				print "%s '%s' (%s)" % (psid, t, nsid)
+def _rename(src, dst):
+	"""
+	Renames @src to @dst, replacing @dst.
+	"""
 
-		# Next page please
-		pg += 1
+	# Windows will not rename over an existing file so that is the one case where it is not atomic
+	if os.name == 'nt' and os.path.exists(dst):
+		os.unlink(dst)
 
-	return favorites
+	os.rename(src, dst)
 
-def _put_favorites(favorites, sdir):
-	f = _openxml(sdir, 'favorites.xml')
-	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-	f.write('<asofa>\n')
-	f.write('\t<favorites>\n')
+def _openxml(sdir, name):
+	"""
+	Checks that @sdir exists.
+	Returns a write-only file object to @name that is only written to disk when closed and the content has changed.
+	"""
 
-	# Write favorites in order by psid
-	keys = favorites.keys()
-	keys.sort()
-	for key in keys:
-		c = favorites[key]
+	# Make sure directory exists
+	_mkdir(sdir)
 
-		f.write('\t\t<favorite id="%s" owner="%s" title="%s" />\n' % (c['psid'], c['owner'], c['title']))
+	return XMLFile(sdir + name)
 
-	f.write('\t</favorites>\n')
-	f.write('</asofa>\n')
-	f.close()
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+# Checkpoint journal
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
 
+# Open journals, to be told when batched XML files are on disk
+_journals = []
 
-def fsync_groups(sdir, u, quiet):
+class Journal:
 	"""
-	Sync all the groups.
-	These are the groups the user belongs to.
+	Record of the items of a sync phase that are done, so that a sync that is interrupted and run again skips them.
+	The journal file starts with a JSON object of when it was started, and each line after that is a JSON list of the
+	item's key and a payload the phase needs to rebuild its output.
+	A journal belongs to a particular phase and set of arguments (@kind and @args) and is removed by finish() once
+	the phase completes, or when it is found older than TUNING['journal_age'].
+	An item is only written to the journal once the XML files written before it are on disk, so that with
+	TUNING['fsync_batch'] it never claims work that a crash would lose.
 	"""
 
-	if not quiet: print 'Syncing groups (r)...'
+	def __init__(self, sdir, kind, args=()):
+		_mkdir(sdir)
 
-	# Pull down groups from Flickr and write to file
-	groups = _get_groups(u.Flickr.FlickrAPI, u.getNSID(), quiet)
-	_put_groups(groups, sdir)
+		sig = hashlib.md5(repr(args)).hexdigest()[:8]
+		self.name = sdir + 'journal-%s-%s.txt' % (kind, sig)
 
-def _get_groups(api, nsid, quiet):
-	# Accumulate groups here and key by photo id
-	groups = {}
+		# Items done by an earlier run, key -> payload
+		self.done = collections.OrderedDict()
 
-	ret = api.people_getPublicGroups(user_id=nsid)
-	grps = ret.find('groups')
+		# Unix time the journal was started
+		self.created = time.time()
 
+		if os.path.exists(self.name):
+			# Should the first line be lost, the last time it was written to is close enough
+			self.created = os.path.getmtime(self.name)
 
-	for grp in grps.findall('group'):
-		nsid = grp.attrib['nsid']
-		name = grp.attrib['name']
-		admin = len(grp.attrib['admin']) and bool(int(grp.attrib['admin'])) or False
-		adult = len(grp.attrib['eighteenplus']) and bool(int(grp.attrib['eighteenplus'])) or False
+			f = open(self.name, 'r')
+			for line in f:
+				# The last line may be cut short by a crash
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					continue
 
-		groups[nsid] = {'nsid': nsid, 'name': name, 'admin': admin, 'adult': adult}
+				# The first line is the header
+				if isinstance(entry, dict):
+					self.created = entry.get('created', self.created)
+					continue
 
-		if not quiet:
-			print "%s '%s' (admin=%s, adult=%s)" % (nsid, name, admin, adult)
+				key,payload = entry
+				self.done[_utf8(key)] = _utf8(payload)
+			f.close()
 
-	return groups
+			# What an old interrupted sync listed may well have changed on Flickr since, so start over
+			if TUNING['journal_age'] and time.time() - self.created > TUNING['journal_age']:
+				self.done.clear()
+				os.unlink(self.name)
+				self.created = time.time()
 
-def _put_groups(groups, sdir):
-	f = _openxml(sdir, 'groups.xml')
-	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-	f.write('<asofa>\n')
-	f.write('\t<groups>\n')
+		# Items done but held back until the batched XML files are on disk
+		self._waiting = []
 
-	# Write groups in order by nsid
-	keys = groups.keys()
-	keys.sort()
-	for key in keys:
-		c = groups[key]
+		_pendinglock.acquire()
+		try:
+			_journals.append(self)
+		finally:
+			_pendinglock.release()
 
-		f.write('\t\t<group id="%s" name="%s" admin="%s" adult="%s" />\n' % (c['nsid'], c['name'], int(c['admin']), int(c['adult'])))
+	def __contains__(self, key):
+		return key in self.done
 
-	f.write('\t</groups>\n')
-	f.write('</asofa>\n')
-	f.close()
+	def __len__(self):
+		return len(self.done)
 
+	def get(self, key):
+		"""
+		Get the payload recorded for item @key.
+		"""
 
-def fsync_collections(sdir, u, quiet, ids, recurse):
-	"""
-	Sync all the collections.
-	"""
+		return self.done[key]
 
-	if not quiet: print 'Syncing collections (c)...'
+	def add(self, key, payload=None):
+		"""
+		Record item @key as done with @payload, safe to call from worker threads.
+		"""
 
-	# Accumulate collections here and key by collection id (both flat and tree)
-	collections = {}
+		_pendinglock.acquire()
+		try:
+			self._waiting.append(json.dumps([key, payload]))
 
-	if len(ids):
-		# Step through each collection and pull down the entire sub-tree of that collection
-		# Skip a collection if it's already in @collections (it was pulled down by another collection)
+			if not len(_pending):
+				self._commit()
+		finally:
+			_pendinglock.release()
 
-		for cid in ids:
-			# Skip, already done
-			if cid in collections: continue
+	def _commit(self):
+		"""
+		Write the items held back to the journal file and sync it, with _pendinglock already held.
+		"""
 
-			# Pull down sub-collection
-			ret = u.Flickr.FlickrAPI.collections_getTree(collection_id=cid)
-			cols = ret.find('collections')
+		if not len(self._waiting):
+			return
 
-			for col in cols.findall('collection'):
-				_fsync_collections_fetch(u, collections, col, None, quiet)
+		lines = self._waiting
+		if not os.path.exists(self.name):
+			lines = [json.dumps({'created': self.created})] + lines
 
-			# Collect set id's
-			sids = []
+		f = open(self.name, 'a')
+		f.write(''.join([line + '\n' for line in lines]))
+		f.flush()
+		os.fsync(f.fileno())
+		f.close()
 
-			# Don't bother checking @recurse since it's required and check is done in parseopts()
-			for cid,cs in collections.items():
-				for c in cs:
-					for sid in c['sets']:
-						if sid not in sids: sids.append(sid)
+		del self._waiting[:]
 
-			fsync_sets(sdir, u, quiet, sids, recurse)
+	def finish(self):
+		"""
+		The phase completed: get its XML files onto disk and remove the journal.
+		"""
 
-	else:
-		# Get all collections
-		ret = u.Flickr.FlickrAPI.collections_getTree()
-		cols = ret.find('collections')
+		_pendinglock.acquire()
+		try:
+			# Otherwise a crash could lose files of the phase along with the journal that would redo them
+			_flushxml()
 
-		for col in cols.findall('collection'):
-			_fsync_collections_fetch(u, collections, col, None, quiet)
+			_journals.remove(self)
+			del self._waiting[:]
+		finally:
+			_pendinglock.release()
 
+		if os.path.exists(self.name):
+			os.unlink(self.name)
 
-		f = _openxml(sdir, 'collections.xml')
-		f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-		f.write('<asofa>\n')
-		f.write('\t<collections>\n')
+def _utf8(obj):
+	"""
+	Encode the unicode strings in @obj, as decoded from JSON, to UTF-8 like the rest of the sync uses.
+	"""
 
-		# Dump root collection
-		_fsync_collections_dump(f, collections, collections[None])
+	if isinstance(obj, unicode):
+		return obj.encode('utf-8')
+	elif isinstance(obj, list):
+		return [_utf8(z) for z in obj]
+	elif isinstance(obj, dict):
+		return dict([(_utf8(k), _utf8(v)) for k,v in obj.items()])
 
-		f.write('\t</collections>\n')
-		f.write('</asofa>\n')
-		f.close()
+	return obj
 
-def _fsync_collections_fetch(u, collections, col, parent, quiet):
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+# Worker threads
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+
+class Job:
 	"""
-	Recursively fetch collection information from @col since @col is a hierarchial structure.
-	Store into @collections.
-	Parent collection ID is @parent.
+	A function call submitted to a WorkerPool.
 	"""
 
-	cid = col.attrib['id']
-	realcid = cid.split('-')[1]
+	def __init__(self, func, args, kwargs):
+		self._func = func
+		self._args = args
+		self._kwargs = kwargs
 
-	t = col.attrib['title'].encode('utf-8')
-	d = col.attrib['description']
-	iconphotos = {'mosaic': {}, 'icons': []}
+		# Set once the call has returned or raised
+		self._done = threading.Event()
+		self._result = None
+		self._exc = None
 
-	if d:
-		d = d.encode('utf-8')
+	def run(self):
+		"""
+		Runs the call and keeps the result or the exception raised.
+		"""
 
-	# Get collection information
-	ret = u.Flickr.FlickrAPI.collections_getInfo(collection_id=cid)
+		try:
+			self._result = self._func(*self._args, **self._kwargs)
+		except:
+			self._exc = sys.exc_info()
+
+		self._done.set()
+
+	def wait(self):
+		"""
+		Waits for the call to finish.
+		"""
+
+		# Wait in small increments so that Ctrl-C still gets through to the main thread
+		while not self._done.wait(0.1):
+			pass
+
+	def result(self):
+		"""
+		Waits for the call to finish and returns its result.
+		If the call raised an exception then it is re-raised here.
+		"""
+
+		self.wait()
+
+		if self._exc != None:
+			raise self._exc[0], self._exc[1], self._exc[2]
+
+		return self._result
+
+def fanout(*calls):
+	"""
+	Makes each of @calls concurrently and returns a list of their results in the same order.
+	Each call is a tuple of a function followed by its arguments.
+	The first call is made on the current thread and the rest on a thread each.
+	If any call raises an exception then it is re-raised once all calls have finished.
+	"""
+
+	jobs = [Job(c[0], c[1:], {}) for c in calls]
+
+	threads = []
+	for job in jobs[1:]:
+		t = threading.Thread(target=job.run)
+		t.daemon = True
+		t.start()
+
+		threads.append(t)
+
+	jobs[0].run()
+
+	# Wait for everything before raising so no call outlives this one
+	for job in jobs:
+		job.wait()
+
+	return [job.result() for job in jobs]
+
+class WorkerPool:
+	"""
+	A fixed number of daemon threads that run submitted function calls.
+	With @jobs of 1 no threads are started and calls are run immediately in the calling thread,
+	which is exactly the serial behavior.
+	"""
+
+	def __init__(self, jobs):
+		self.jobs = max(int(jobs), 1)
+
+		self._queue = Queue.Queue()
+		self._threads = []
+
+		if self.jobs > 1:
+			for i in xrange(self.jobs):
+				t = threading.Thread(target=self._work)
+				t.daemon = True
+				t.start()
+
+				self._threads.append(t)
+
+	def _work(self):
+		"""
+		Thread body: run jobs until told to stop with a None.
+		"""
+
+		while True:
+			job = self._queue.get()
+			if job == None:
+				break
+
+			job.run()
+
+	def submit(self, func, *args, **kwargs):
+		"""
+		Queues the call of @func with @args and @kwargs and returns its Job.
+		"""
+
+		job = Job(func, args, kwargs)
+
+		if len(self._threads):		self._queue.put(job)
+		else:						job.run()
+
+		return job
+
+	def imap(self, func, items):
+		"""
+		Calls @func on each of @items and yields the results in the order of @items.
+		Only a window of twice the number of threads is queued at a time so that when the
+		consumer stops (eg, on an exception) little work has been started needlessly.
+		"""
+
+		pending = collections.deque()
+
+		for item in items:
+			pending.append(self.submit(func, item))
+
+			if len(pending) >= 2 * self.jobs:
+				yield pending.popleft().result()
+
+		while len(pending):
+			yield pending.popleft().result()
+
+	def map(self, func, items):
+		"""
+		Calls @func on each of @items and returns a list of the results in the order of @items.
+		"""
+
+		return list(self.imap(func, items))
+
+	def close(self):
+		"""
+		Stops the threads once the work already queued is done and waits for them to finish.
+		"""
+
+		for t in self._threads:
+			self._queue.put(None)
+
+		# Join in small increments so that Ctrl-C still gets through to the main thread
+		for t in self._threads:
+			while t.isAlive():
+				t.join(0.1)
+
+		self._threads = []
+
+def paginate(method, onpage=None, prefetch=True, **kwargs):
+	"""
+	Calls the paged Flickr API @method with @kwargs for every page and yields the records in order.
+	Pages are as large as PERPAGE allows for @method.
+	The first page tells how many pages there are, after which up to TUNING['prefetch'] of the following pages are
+	fetched concurrently while the records of earlier pages are consumed.
+	If given, @onpage is called with the page number and number of pages as each page is reached.
+	With @prefetch False the pages are fetched one after another instead, which is for listings fetched for every
+	photo where the threads of a pool per call would add up.
+	"""
+
+	perpage = PERPAGE.get(method.method, 100)
+
+	def fetch(pg):
+		return method(per_page=perpage, page=pg, format='stream', **kwargs)
+
+	ret = fetch(1)
+	pages = int(ret.attrib.get('pages', 1))
+
+	if onpage != None: onpage(1, pages)
+	for r in ret:
+		yield r
+
+	if pages <= 1:
+		return
+
+	if not prefetch:
+		for pg in xrange(2, pages + 1):
+			if onpage != None: onpage(pg, pages)
+			for r in fetch(pg):
+				yield r
+		return
+
+	pool = WorkerPool(min(TUNING['prefetch'], pages - 1))
+	try:
+		pg = 2
+		for ret in pool.imap(fetch, xrange(2, pages + 1)):
+			if onpage != None: onpage(pg, pages)
+			for r in ret:
+				yield r
+
+			pg += 1
+	finally:
+		pool.close()
+
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+# XML reader classes
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+
+class SetsXMLReader(handler.ContentHandler):
+	"""
+	XML reader for the sets.xml
+	"""
+
+	def __init__(self):
+		# Current set id for when a <photo> is encountered
+		self._sid = None
+
+		# Dictionary keyed on set id to a dictionary of id, title, description, primary, and an IDArray of things (photo or video id)
+		self.sets = {}
+
+		# List of set id's as presented in the file
+		self.sids = []
+
+	def startElement(self, name, attrs):
+		"""
+		Catches starts of <photo> and <set> and populates self.sets and self.sids appropriately.
+		"""
+
+		if name == 'set':
+			# Unescape everything
+			sid = xml.sax.saxutils.unescape(attrs['id'])
+			t = xml.sax.saxutils.unescape(attrs['title'])
+			d = xml.sax.saxutils.unescape(attrs['description'])
+			prim = xml.sax.saxutils.unescape(attrs['primary'])
+
+			# Set current set id and add to list
+			self._sid = sid
+			self.sids.append(sid)
+
+			# Create data dictionary and populate
+			self.sets[sid] = {}
+			self.sets[sid]['id'] = sid
+			self.sets[sid]['title'] = t.encode('utf-8')
+			self.sets[sid]['description'] = d.encode('utf-8').replace('<br />', '\n')
+			self.sets[sid]['primary'] = prim
+			self.sets[sid]['things'] = IDArray()
+
+		elif name == 'photo':
+			pid = attrs['id']
+			self.sets[self._sid]['things'].append(pid)
+
+class LastSyncXMLReader(handler.ContentHandler):
+	"""
+	XML reader for the lastsync.xml
+	"""
+
+	def __init__(self):
+		# Unix time that the last full or incremental photo sync started
+		self.date = None
+
+	def startElement(self, name, attrs):
+		"""
+		Catches the start of <lastsync> and populates self.date.
+		"""
+
+		if name == 'lastsync':
+			self.date = int(attrs['date'])
+
+class FailedXMLReader(handler.ContentHandler):
+	"""
+	XML reader for the failed.xml
+	"""
+
+	def __init__(self):
+		# Photo id's that failed to sync mapped to the error, in the order listed
+		self.failed = collections.OrderedDict()
+
+	def startElement(self, name, attrs):
+		"""
+		Catches starts of <photo> and populates self.failed.
+		"""
+
+		if name == 'photo':
+			self.failed[attrs['id']] = attrs['error']
+
+class PhotosXMLReader(handler.ContentHandler):
+	"""
+	XML reader for the photos.xml
+	"""
+
+	def __init__(self):
+		# PhotoIndex of photo id's as presented in the file
+		self.pids = PhotoIndex()
+
+	def startElement(self, name, attrs):
+		"""
+		Catches starts of <photo> and populates self.pids appropriately.
+		"""
+
+		if name == 'photo':
+			pid = xml.sax.saxutils.unescape(attrs['id'])
+
+			# add to index
+			self.pids.append(pid)
+
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+# Sync routines
+#------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+
+def fsync_contacts(sdir, u, quiet):
+	"""
+	Sync all the contacts.
+	"""
+
+	if not quiet: print 'Syncing contacts (t)...'
+
+	# Pull down contacts from Flickr and write to file
+	contacts = _get_contacts(u.Flickr.FlickrAPI, quiet)
+	_put_contacts(contacts, sdir)
+
+
+def _get_contacts(api, quiet):
+	# Accumulate contacts here and key by nsid
+	contacts = {}
+
+	# Multiple pages
+	for cntct in paginate(api.contacts_getList):
+		nsid = cntct.attrib['nsid']
+		user = cntct.attrib['username']
+		name = cntct.attrib['realname']
+		fam = bool(int(cntct.attrib['family']))
+		fri = bool(int(cntct.attrib['friend']))
+		ign = bool(int(cntct.attrib['ignored']))
+
+		contacts[nsid] = {'nsid': nsid, 'name': name, 'username': user, 'family': fam, 'friend': fri, 'ignored': ign}
+
+		if not quiet:
+			print "%s as %s (%s): family=%s, friend=%s, ignored=%s" % (name, user, nsid, fam, fri, ign)
+
+	return contacts
+
+def _put_contacts(contacts, sdir):
+	f = _openxml(sdir, 'contacts.xml')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	f.write('<asofa>\n')
+	f.write('\t<contacts>\n')
+
+	# Write contacts in order by nsid
+	keys = contacts.keys()
+	keys.sort()
+	for key in keys:
+		c = contacts[key]
+
+		f.write('\t\t<contact nsid="%s" realname="%s" username="%s" family="%d" friend="%d" ignored="%d" />\n' % (c['nsid'], c['name'], c['username'], int(c['family']), int(c['friend']), int(c['ignored'])))
+
+	f.write('\t</contacts>\n')
+	f.write('</asofa>\n')
+	f.close()
+
+
+def fsync_favorites(sdir, u, quiet):
+	"""
+	Sync all the favorites.
+	These are the favorites by the user, not photos by the user that have been favorited by others.
+	"""
+
+	if not quiet: print 'Syncing favorites (f)...'
+
+	# Pull down favorites from Flickr and write to file
+	favs = _get_favorites(u.Flickr.FlickrAPI, quiet)
+	_put_favorites(favs, sdir)
+
+def _get_favorites(api, quiet):
+	# Accumulate favorites here and key by photo id
+	favorites = {}
+
+	# Multiple pages
+	for pht in paginate(api.favorites_getList):
+		psid = pht.attrib['id']
+		nsid = pht.attrib['owner']
+		t = pht.attrib['title'].encode('utf-8')
+
+		favorites[psid] = {'psid': psid, 'owner': nsid, 'title': t}
+
+		if not quiet:
+			print "%s '%s' (%s)" % (psid, t, nsid)
+
+	return favorites
+
+def _put_favorites(favorites, sdir):
+	f = _openxml(sdir, 'favorites.xml')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	f.write('<asofa>\n')
+	f.write('\t<favorites>\n')
+
+	# Write favorites in order by psid
+	keys = favorites.keys()
+	keys.sort()
+	for key in keys:
+		c = favorites[key]
+
+		f.write('\t\t<favorite id="%s" owner="%s" title="%s" />\n' % (c['psid'], c['owner'], c['title']))
+
+	f.write('\t</favorites>\n')
+	f.write('</asofa>\n')
+	f.close()
+
+
+def fsync_groups(sdir, u, quiet):
+	"""
+	Sync all the groups.
+	These are the groups the user belongs to.
+	"""
+
+	if not quiet: print 'Syncing groups (r)...'
+
+	# Pull down groups from Flickr and write to file
+	groups = _get_groups(u.Flickr.FlickrAPI, u.getNSID(), quiet)
+	_put_groups(groups, sdir)
+
+def _get_groups(api, nsid, quiet):
+	# Accumulate groups here and key by photo id
+	groups = {}
+
+	ret = api.people_getPublicGroups(user_id=nsid)
+	grps = ret.find('groups')
+
+
+	for grp in grps.findall('group'):
+		nsid = grp.attrib['nsid']
+		name = grp.attrib['name']
+		admin = len(grp.attrib['admin']) and bool(int(grp.attrib['admin'])) or False
+		adult = len(grp.attrib['eighteenplus']) and bool(int(grp.attrib['eighteenplus'])) or False
+
+		groups[nsid] = {'nsid': nsid, 'name': name, 'admin': admin, 'adult': adult}
+
+		if not quiet:
+			print "%s '%s' (admin=%s, adult=%s)" % (nsid, name, admin, adult)
+
+	return groups
+
+def _put_groups(groups, sdir):
+	f = _openxml(sdir, 'groups.xml')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	f.write('<asofa>\n')
+	f.write('\t<groups>\n')
+
+	# Write groups in order by nsid
+	keys = groups.keys()
+	keys.sort()
+	for key in keys:
+		c = groups[key]
+
+		f.write('\t\t<group id="%s" name="%s" admin="%s" adult="%s" />\n' % (c['nsid'], c['name'], int(c['admin']), int(c['adult'])))
+
+	f.write('\t</groups>\n')
+	f.write('</asofa>\n')
+	f.close()
+
+
+def fsync_collections(sdir, u, quiet, ids, recurse):
+	"""
+	Sync all the collections.
+	If collection @ids are provided then the sets in them and their photos are synced instead, each once.
+	"""
+
+	if not quiet: print 'Syncing collections (c)...'
+
+	# Accumulate collections here and key by collection id (both flat and tree)
+	collections = {}
+
+	if len(ids):
+		# Plan the whole sync first so that a set or photo in several of the collections is synced once
+		plan = _plan_collections(u.Flickr.FlickrAPI, ids)
+
+		if not quiet:
+			print 'Planned %d collections with %d sets (%d as listed in the collections)' % (len(plan['collections']), len(plan['sets']), plan['listed'])
+
+		sets = STATS['sets']
+		photos = STATS['photos']
+
+		# Don't bother checking @recurse since it's required and check is done in parseopts()
+		pids = fsync_sets(sdir, u, quiet, plan['sets'], recurse)
+
+		if not quiet:
+			print 'Synced %d of %d planned sets and %d of %d planned photos' % (STATS['sets'] - sets, len(plan['sets']), STATS['photos'] - photos, len(pids))
+
+		return
+
+	# Running the same sync again picks up where this one is interrupted
+	journal = Journal(sdir, 'collections', [str(_z) for _z in ids])
+
+	# Get all collections
+	ret = u.Flickr.FlickrAPI.collections_getTree()
+	cols = ret.find('collections')
+
+	_fsync_collections_fetch(u, collections, cols.findall('collection'), quiet, journal)
+
+
+	f = _openxml(sdir, 'collections.xml')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	f.write('<asofa>\n')
+	f.write('\t<collections>\n')
+
+	# Dump root collection
+	_fsync_collections_dump(f, collections, collections[None])
+
+	f.write('\t</collections>\n')
+	f.write('</asofa>\n')
+	f.close()
+
+	journal.finish()
+
+def _plan_collections(api, ids):
+	"""
+	Plan the sync of the collections @ids and everything in them.
+	The tree of each collection is fetched once, skipping a collection already found inside another, and the sets
+	 in all of them are gathered without duplicates.
+	Returns a dictionary with 'collections' and 'sets', each an OrderedSet of id's, and 'listed', the number of
+	 sets as listed in the collections before the duplicates were dropped.
+	"""
+
+	plan = {'collections': OrderedSet(), 'sets': OrderedSet(), 'listed': 0}
+
+	for cid in ids:
+		# Skip, already found in the tree of another collection
+		if cid in plan['collections']: continue
+
+		# Pull down sub-collection
+		ret = api.collections_getTree(collection_id=cid)
+		cols = ret.find('collections')
+
+		for col in cols.findall('collection'):
+			_plan_collections_walk(plan, col)
+
+	return plan
+
+def _plan_collections_walk(plan, col):
+	"""
+	Recursively add collection @col, its sets, and its sub-collections to @plan.
+	"""
+
+	plan['collections'].add(col.attrib['id'])
+
+	sids = [s.attrib['id'] for s in col.findall('set')]
+	plan['listed'] += len(sids)
+	plan['sets'].update(sids)
+
+	for c in col.findall('collection'):
+		_plan_collections_walk(plan, c)
+
+def _fsync_collections_fetch(u, collections, cols, quiet, journal):
+	"""
+	Fetch collection information for the root collections @cols and every collection under them.
+	Store into @collections.
+	Information already fetched by an interrupted sync is taken from @journal.
+	"""
+
+	# The whole tree came with collections_getTree() so every collection is known before any information is fetched
+	nodes = []
+	for col in cols:
+		_fsync_collections_walk(col, None, nodes)
+
+	def dowork(cid):
+		return (cid, _get_collection_info(u.Flickr.FlickrAPI, cid))
+
+	# Information by collection id, starting with what an interrupted sync already fetched
+	infos = {}
+	work = []
+	for col,parent in nodes:
+		cid = col.attrib['id']
+
+		if cid in journal:	infos[cid] = journal.get(cid)
+		else:				work.append(cid)
+
+	# Collections are independent so several are fetched at once
+	pool = WorkerPool(min(TUNING['list_jobs'], max(len(work), 1)))
+	try:
+		for cid, info in pool.imap(dowork, work):
+			journal.add(cid, info)
+			infos[cid] = info
+	finally:
+		pool.close()
+
+	# Put the tree back together in its original order
+	for col,parent in nodes:
+		_fsync_collections_add(collections, col, parent, infos[col.attrib['id']], quiet)
+
+def _fsync_collections_walk(col, parent, nodes):
+	"""
+	Recursively append collection @col, whose parent collection ID is @parent, and the collections under it to the
+	list @nodes as 2-tuples of (collection, parent) in depth-first order.
+	"""
+
+	nodes.append((col, parent))
+
+	for c in col.findall('collection'):
+		_fsync_collections_walk(c, col.attrib['id'], nodes)
+
+def _get_collection_info(api, cid):
+	"""
+	Get the icons and creation date of collection @cid.
+	Returns a dictionary with 'icons' and 'ctime'.
+	"""
+
+	iconphotos = {'mosaic': {}, 'icons': []}
+
+	# Get collection information
+	ret = api.collections_getInfo(collection_id=cid)
 	ret2 = ret.find('collection')
 
 	# Pull out individual icons
@@ -669,8 +1654,25 @@ def _fsync_collections_fetch(u, collections, col, parent, quiet):
 	if 'iconsmall' in ret2.attrib:		iconphotos['mosaic']['small'] = ret2.attrib['iconsmall']
 
 	# Pull out creation date
-	ctime = ret2.attrib['datecreate']
-	ctimestr = datetime.datetime.fromtimestamp(float(ret2.attrib['datecreate']))
+	return {'icons': iconphotos, 'ctime': ret2.attrib['datecreate']}
+
+def _fsync_collections_add(collections, col, parent, info, quiet):
+	"""
+	Store collection @col with the information @info from _get_collection_info() into @collections.
+	Parent collection ID is @parent.
+	"""
+
+	cid = col.attrib['id']
+
+	t = col.attrib['title'].encode('utf-8')
+	d = col.attrib['description']
+
+	if d:
+		d = d.encode('utf-8')
+
+	iconphotos = info['icons']
+	ctime = info['ctime']
+	ctimestr = datetime.datetime.fromtimestamp(float(ctime))
 
 
 
@@ -693,10 +1695,6 @@ def _fsync_collections_fetch(u, collections, col, parent, quiet):
 	if not quiet:
 		print '%s "%s"' % (cid, t)
 
-	# Recurse into sub-collections
-	for c in col.findall('collection'):
-		_fsync_collections_fetch(u, collections, c, cid, quiet)
-
 def _fsync_collections_dump(f, collections, cs, indent=2):
 	"""
 	Recursively dump collection information from @collections back into a tree structure.
@@ -759,499 +1757,905 @@ def _fsync_collections_dump(f, collections, cs, indent=2):
 def fsync_sets(sdir, u, quiet, ids, recurse):
 	"""
 	Sync all of the photosets.
+	If @recurse then the photos in the sets @ids are synced too, each once however many of the sets it is in.
+	Returns an OrderedSet of the id's of the photos in the sets @ids.
 	"""
 
 	if not quiet: print 'Syncing sets (s)...'
 
-	sets = _get_sets(u.Flickr.FlickrAPI, ids, sdir, quiet)
+	# Running the same sync again picks up where this one is interrupted
+	journal = Journal(sdir, 'sets', [str(_z) for _z in ids])
+
+	# What the set listings tell about each photo, only wanted when the photos are synced next
+	hints = None
+	if recurse and len(ids):
+		hints = {}
+
+	sets = _get_sets(u.Flickr.FlickrAPI, ids, sdir, quiet, journal, hints)
 	_put_sets(sets, sdir)
 
+	journal.finish()
+
+	# Get all photo ids in all sets, in the order of @ids
+	things = dict([(st['id'], st['things']) for st in sets])
+
+	pids = OrderedSet()
+	for sid in ids:
+		# Add photo id's unique to the sets
+		pids.update(things.get(sid, []))
+
 	# Recursion
 	if len(ids) and recurse:
-		pids = []
+		# Pull down photos in all sets listed
+		fsync_photos(sdir, u, quiet, pids, hints=hints)
+
+	return pids
+
+def _get_sets(api, ids, sdir, quiet, journal, hints):
+	"""
+	Get the sets @ids, or all sets if there are none, with the id's of the photos in each.
+	If @hints is a dictionary, what the listings tell about each photo is put in it.
+	Sets already listed by an interrupted sync are taken from @journal.
+	"""
+
+	# Accumulate sets here
+	sets = []
+
+	if len(ids):
+		fname = sdir + 'sets.xml'
+		_landxml(fname)
+
+		if not os.path.exists(fname):
+			raise Exception('Must have fully synchronized sets before syncing individual sets')
+
+		p = make_parser()
+		sr = SetsXMLReader()
+		p.setContentHandler(sr)
+		p.parse(fname)
 
-		# Get all photo ids in all sets
+		# Do just the sets provided as arguments
 		for sid in ids:
-			# Multiple pages
-			pg = 1
-			pages = 1
-			perpage = 100
+			ret = api.photosets_getInfo(photoset_id=sid)
+			ps = ret.find('photoset')
+
+			sid = ps.attrib['id']
+			prim = ps.attrib['primary']
+			t = (ps.find('title').text or '').encode('utf-8')
+			d = (ps.find('description').text or '').encode('utf-8')
+
+			st = {'id': sid, 'primary': prim, 'title': t, 'description': d, 'things': IDArray()}
+
+			sr.sets[sid] = st
+
+		# Pull down all sets to get the proper order
+		ret = api.photosets_getList()
+		ret2 = ret.find('photosets')
+
+		# Copy set information from the xml reader into the @sets list in the order found on flickr
+		for ps in ret2.findall('photoset'):
+			sid = ps.attrib['id']
+
+			# Only copy set info if present on flickr
+			if sid in sr.sets:
+				sets.append(sr.sets[sid])
+
+	else:
+		# Pull down all sets
+		ret = api.photosets_getList()
+		ret2 = ret.find('photosets')
+
+		# Get all set information first
+		for ps in ret2.findall('photoset'):
+			sid = ps.attrib['id']
+			prim = ps.attrib['primary']
+			t = (ps.find('title').text or '').encode('utf-8')
+			d = (ps.find('description').text or '').encode('utf-8')
+
+			st = {'id': sid, 'primary': prim, 'title': t, 'description': d, 'things': IDArray()}
+
+			sets.append(st)
+
+	# Get photos in each set
+	cnt = 0
+	maxcnt = len(sets)
+	if len(ids): maxcnt = len(ids) # Maximum count is of the ids if they are presented, otherwise it is the full number of sets
+
+	def dowork(st):
+		# Already done by an interrupted sync
+		if st['id'] in journal:
+			return (st, None, None)
+
+		# Get thing id's as the pages come in, and what the extras tell for syncing the photos in them if wanted
+		things = IDArray()
+		found = {}
+
+		if hints == None:
+			for p in paginate(api.photosets_getPhotos, photoset_id=st['id']):
+				things.append(p.attrib['id'])
+
+		else:
+			for p in paginate(api.photosets_getPhotos, photoset_id=st['id'], extras=LISTING_EXTRAS):
+				things.append(p.attrib['id'])
+				found[p.attrib['id']] = _photo_hints(p)
+
+		return (st, things, found)
+
+	# Skip sets not in the list of ids
+	work = [_st for _st in sets if not len(ids) or _st['id'] in ids]
+
+	# Sets are independent so several are listed at once, and taken in the order of @sets
+	started = time.time()
+	pool = WorkerPool(min(TUNING['list_jobs'], max(len(work), 1)))
+	try:
+		for st, things, found in pool.imap(dowork, work):
+			# UI counter
+			cnt += 1
+
+			if things == None:
+				st['things'] = IDArray(journal.get(st['id']))
+
+			else:
+				st['things'] = things
+				if hints != None:
+					hints.update(found)
+
+				journal.add(st['id'], list(st['things']))
+				count('sets')
+
+			if not quiet:
+				print '%4d of %4d: %s (%d things, %.1f sets/s)' % (cnt, maxcnt, st['title'], len(st['things']), cnt / max(time.time() - started, 1e-3))
+	finally:
+		pool.close()
+
+	return sets
+
+def _put_sets(sets, sdir):
+	f = _openxml(sdir, 'sets.xml')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	f.write('<asofa>\n')
+	f.write('\t<sets>\n')
+
+	# Write groups in order presented
+	for st in sets:
+		_st = {}
+		_st['id'] = esc(st['id'])
+		_st['title'] = esc(st['title'])
+		_st['description'] = esc(unesc(st['description'].replace('\n', '<br />')))
+		_st['primary'] = esc(st['primary'])
+
+		f.write('\t\t<set id="{id}" title="{title}" description="{description}" primary="{primary}">\n'.format(**_st))
+
+		for p in st['things']:
+			f.write('\t\t\t<photo id="%s" />\n' % p)
+
+		f.write('\t\t</set>\n')
+
+
+	f.write('\t</sets>\n')
+	f.write('</asofa>\n')
+	f.close()
+
+def fsync_galleries(sdir, u, quiet):
+	"""
+	Sync all of the galleries.
+	"""
+
+	if not quiet: print 'Syncing galleries (g)...'
+
+	# Running again picks up where an interrupted sync left off
+	journal = Journal(sdir, 'galleries')
+
+	# Pull down galleries from Flickr and write to file
+	galleries = _get_galleries(u.Flickr.FlickrAPI, u.getNSID(), quiet, journal)
+	_put_galleries(galleries, sdir)
+
+	journal.finish()
+
+def _get_galleries(api, nsid, quiet, journal):
+	# Get all galleries
+	galleries = []
+
+	for g in paginate(api.galleries_getList, user_id=nsid):
+		gl = {}
+		gl['id'] = g.attrib['id']
+		gl['owner'] = g.attrib['owner']
+		gl['created'] = g.attrib['date_create']
+		gl['updated'] = g.attrib['date_update']
+		gl['primary'] = g.attrib['primary_photo_id']
+		gl['title'] = g.find('title').text.encode('utf-8')
+		gl['description'] = g.find('description').text.encode('utf-8')
+
+		galleries.append(gl)
+
+	# Get photos in all the galleries
+	for gl in galleries:
+		# Already done by an interrupted sync
+		if gl['id'] in journal:
+			gl['things'] = OwnedIDArray(journal.get(gl['id']))
+
+		else:
+			gl['things'] = OwnedIDArray()
+			for p in paginate(api.galleries_getPhotos, gallery_id=gl['id']):
+				gl['things'].append(p.attrib['id'], p.attrib['owner'])
+
+			journal.add(gl['id'], list(gl['things']))
+
+		if not quiet:
+			print "%s '%s' (%d things)" % (gl['id'], gl['title'], len(gl['things']))
+
+	return galleries
+
+def _put_galleries(galleries, sdir):
+	f = _openxml(sdir, 'galleries.xml')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	f.write('<asofa>\n')
+	f.write('\t<galleries>\n')
+
+	# Write groups in order presented
+	for gal in galleries:
+		f.write('\t\t<gallery id="%s" title="%s" description="%s" primary="%s">\n' % (gal['id'], (gal['title'] or '').encode('utf-8'), (gal['description'] or '').encode('utf-8'), gal['primary']))
+
+		for p in gal['things']:
+			f.write('\t\t\t<thing id="{id}" owner="{owner}" />\n'.format(**p))
+
+		f.write('\t\t</gallery>\n')
+
+
+	f.write('\t</galleries>\n')
+	f.write('</asofa>\n')
+	f.close()
+
+def fsync_photos(sdir, u, quiet, ids, resume=None, date=None, incremental=False, hints=None):
+	"""
+	Sync all the photos.
+	If @incremental then only the photos updated since the last full or incremental sync are synced.
+	@hints is a dictionary of photo id to what a listing told about the photo (see _photo_hints()), filled in
+	 here from the listings of all photos and of updated photos.
+	"""
+
+	if not quiet: print 'Syncing photos (p)...'
+
+	# Photos updated after this are left for the next incremental sync
+	started = int(time.time())
+
+	# Only a sync that looks at every photo can record when it started for the next incremental sync
+	full = incremental or (not len(ids) and date == None and resume == None)
+
+	# Running the same sync again picks up where this one is interrupted
+	sig = ([str(_z) for _z in ids], date, incremental)
+
+	if hints == None:
+		hints = {}
+
+	if incremental:
+		since = _get_lastsync(sdir)
+
+		if since == None:
+			if not quiet: print 'No previous sync recorded in %slastsync.xml, syncing all photos' % sdir
+
+		else:
+			ids = _get_updated(u.Flickr.FlickrAPI, since, quiet, hints)
+
+			if not len(ids):
+				_put_lastsync(sdir, started)
+				return
+
+	pids = OrderedSet()
+
+	if len(ids) or resume:
+		ids = [unicode(_z) for _z in ids]
+
+		# Check that file doesn't exist
+		fname = sdir + 'photos.xml'
+		_landxml(fname)
+
+		if not os.path.exists(fname):
+			raise Exception('Must have fully synchronized photos before syncing individual photos')
+
+		index = _get_photo_index(sdir)
+
+		# Merge the photos in the appropriate order
+		pids = mergePIDs(u, index, [_z for _z in ids if _z not in index])
+
+	elif date != None:
+		# Get only popular photos for date @date
+
+		# Enumerate through date range
+		days = []
+		d = date[0]
+		delta = datetime.timedelta(days=1)
+		while d <= date[1]:
+			days.append(d)
+
+			# Go to next day
+			d = d + delta
+
+		def dowork(d):
+			return _get_popular(u.Flickr.FlickrAPI, d)
+
+		# Days are independent so several are fetched at once, and merged in date order
+		pool = WorkerPool(min(TUNING['date_jobs'], len(days)))
+		try:
+			for d, dpids in pool.imap(dowork, days):
+				print 'Dates: %s (%d photos)' % (d, len(dpids))
+
+				pids.update(dpids)
+		finally:
+			pool.close()
+
+	else:
+		def onpage(pg, pages):
+			if quiet:
+				return
+
+			if pg == 1:
+				print 'Getting %d total pages of photos starting with page %d: ' % (pages, pg)
+
+			if pg % 1000 == 0:
+				sys.stdout.write('M')
+			elif pg % 100 == 0:
+				sys.stdout.write('C')
+			elif pg % 10 == 0:
+				sys.stdout.write('X')
+			else:
+				sys.stdout.write('.')
+
+			sys.stdout.flush()
+
+		# Multiple pages
+		for p in paginate(u.Flickr.FlickrAPI.people_getPhotos, onpage, user_id=u.getNSID(), extras=LISTING_EXTRAS):
+			pids.add(p.attrib['id'])
+			hints[p.attrib['id']] = _photo_hints(p)
+
+		# Add newline after MCX. outputs
+		print ''
+
+
+	if date == None:
+		# Save a copy of the photo id's only
+		# Don't do if date is provided
+		_put_photos(sdir, pids)
+
+	# Pull down each photo fully
+	if len(ids):
+		# Trim out empty pids
+		ids = [_i for _i in ids if len(_i)]
+	else:
+		# Trim out empty pids (could be from a deleted photo as pulled down for a day's stats)
+		ids = [_i for _i in pids if len(_i)]
+
+	_fsync_photo_list(sdir, u, quiet, ids, resume, Journal(sdir, 'photos', sig), hints)
+
+	if full:
+		_put_lastsync(sdir, started)
+
+def _get_photo_index(sdir):
+	"""
+	Get the PhotoIndex of the photo id's in photos.xml.
+	It is loaded from photos.idx when that was saved for the photos.xml there now, otherwise photos.xml is parsed and
+	 photos.idx saved for the next time.
+	"""
 
-			while pg <= pages:
-				ret = u.Flickr.FlickrAPI.photosets_getPhotos(photoset_id=sid, per_page=perpage, page=pg)
-				photos = ret.find('photoset')
-				pages = int(photos.attrib['pages'])
+	fname = sdir + 'photos.xml'
+	_landxml(fname)
 
-				for p in photos.findall('photo'):
-					# Add photo id if it's unique to the set
-					pid = p.attrib['id']
-					if pid not in pids:
-						pids.append(pid)
+	# Reading and hashing the file is far quicker than parsing it
+	f = open(fname, 'rb')
+	key = hashlib.md5(f.read()).digest()
+	f.close()
 
-				pg += 1
+	index = PhotoIndex.load(sdir + 'photos.idx', key)
+	if index != None:
+		return index
 
-		# Pull down photos in all sets listed
-		fsync_photos(sdir, u, quiet, pids)
+	p = make_parser()
+	pr = PhotosXMLReader()
+	p.setContentHandler(pr)
+	p.parse(fname)
 
-def _get_sets(api, ids, sdir, quiet):
-	# Accumulate sets here
-	sets = []
+	pr.pids.save(sdir + 'photos.idx', key)
 
-	if len(ids):
-		fname = sdir + 'sets.xml'
+	return pr.pids
 
-		if not os.path.exists(fname):
-			raise Exception('Must have fully synchronized sets before syncing individual sets')
+def _put_photos(sdir, pids):
+	"""
+	Write the photo id's @pids to photos.xml, and their PhotoIndex to photos.idx.
+	"""
 
-		p = make_parser()
-		sr = SetsXMLReader()
-		p.setContentHandler(sr)
-		p.parse(fname)
+	data = cStringIO.StringIO()
+	data.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	data.write('<asofa>\n')
+	data.write('\t<photos>\n')
+	for pid in pids:
+		data.write('\t\t<photo id="%s" />\n' % pid)
+	data.write('\t</photos>\n')
+	data.write('</asofa>\n')
+	data = data.getvalue()
+
+	f = _openxml(sdir, 'photos.xml')
+	f.write(data)
+	f.close()
 
-		# Do just the sets provided as arguments
-		for sid in ids:
-			ret = api.photosets_getInfo(photoset_id=sid)
-			ps = ret.find('photoset')
+	# Not ahead of photos.xml itself, which with TUNING['fsync_batch'] may still be held back
+	_landxml(sdir + 'photos.xml')
 
-			sid = ps.attrib['id']
-			prim = ps.attrib['primary']
-			t = (ps.find('title').text or '').encode('utf-8')
-			d = (ps.find('description').text or '').encode('utf-8')
+	# Keyed by the content of photos.xml, so it is only used with the photos.xml it was saved for
+	PhotoIndex(pids).save(sdir + 'photos.idx', hashlib.md5(data).digest())
 
-			st = {'id': sid, 'primary': prim, 'title': t, 'description': d, 'things': []}
+def _get_popular(api, d):
+	"""
+	Get the id's of the popular photos for the day @d.
+	Returns a 2-tuple of (@d, list of id's).
+	"""
 
-			sr.sets[sid] = st
+	# Multiple pages
+	return (d, [p.attrib['id'] for p in paginate(api.stats_getPopularPhotos, date=d)])
 
-		# Pull down all sets to get the proper order
-		ret = api.photosets_getList()
-		ret2 = ret.find('photosets')
+def _get_updated(api, since, quiet, hints):
+	"""
+	Get the id's of the photos updated since the unix time @since.
+	What the listing tells about each photo is put in the dictionary @hints.
+	"""
 
-		# Copy set information from the xml reader into the @sets list in the order found on flickr
-		for ps in ret2.findall('photoset'):
-			sid = ps.attrib['id']
+	pids = OrderedSet()
 
-			# Only copy set info if present on flickr
-			if sid in sr.sets:
-				sets.append(sr.sets[sid])
+	# Multiple pages, going back ten minutes from @since to allow for the local clock being off from Flickr's
+	# A photo updated while paging moves to the front and may be seen twice
+	for p in paginate(api.photos_recentlyUpdated, min_date=since - 600, extras=LISTING_EXTRAS):
+		pids.add(p.attrib['id'])
+		hints[p.attrib['id']] = _photo_hints(p)
 
-	else:
-		# Pull down all sets
-		ret = api.photosets_getList()
-		ret2 = ret.find('photosets')
+	if not quiet:
+		print '%d photos updated since %s' % (len(pids), datetime.datetime.fromtimestamp(since))
 
-		# Get all set information first
-		for ps in ret2.findall('photoset'):
-			sid = ps.attrib['id']
-			prim = ps.attrib['primary']
-			t = (ps.find('title').text or '').encode('utf-8')
-			d = (ps.find('description').text or '').encode('utf-8')
+	return pids
 
-			st = {'id': sid, 'primary': prim, 'title': t, 'description': d, 'things': []}
+def _get_lastsync(sdir):
+	"""
+	Get the unix time the last full or incremental photo sync started, or None if there has not been one.
+	"""
 
-			sets.append(st)
+	fname = sdir + 'lastsync.xml'
+	_landxml(fname)
 
-	# Get photos in each set
-	cnt = 0
-	maxcnt = len(sets)
-	if len(ids): maxcnt = len(ids) # Maximum count is of the ids if they are presented, otherwise it is the full number of sets
+	if not os.path.exists(fname):
+		return None
 
-	for st in sets:
-		# Skip sets not in the list of ids
-		if len(ids) and st['id'] not in ids:
-			continue
+	p = make_parser()
+	lr = LastSyncXMLReader()
+	p.setContentHandler(lr)
+	p.parse(fname)
 
-		# UI counter
-		cnt += 1
+	return lr.date
 
-		# Multiple pages
-		pg = 1
-		pages = 1
-		perpage = 100
+def _put_lastsync(sdir, date):
+	"""
+	Write the unix time @date the photo sync started to lastsync.xml.
+	"""
 
-		while pg <= pages:
-			ret = api.photosets_getPhotos(photoset_id=st['id'], per_page=perpage, page=pg)
-			photos = ret.find('photoset')
-			pages = int(photos.attrib['pages'])
+	f = _openxml(sdir, 'lastsync.xml')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	f.write('<asofa>\n')
+	f.write('\t<lastsync date="%d" datestr="%s" />\n' % (date, datetime.datetime.fromtimestamp(date)))
+	f.write('</asofa>\n')
+	f.close()
 
-			# Get thing id's only
-			st['things'] = st['things'] + [p.attrib['id'] for p in photos.findall('photo')]
+def _get_failed(sdir):
+	"""
+	Get the photos that failed to sync as an OrderedDict of photo id to error, empty if there is no failed.xml.
+	"""
 
-			pg += 1
+	fname = sdir + 'failed.xml'
+	_landxml(fname)
 
-		if not quiet:
-			print '%4d of %4d: %s (%d things)' % (cnt, maxcnt, st['title'], len(st['things']))
+	if not os.path.exists(fname):
+		return collections.OrderedDict()
 
-	return sets
+	p = make_parser()
+	fr = FailedXMLReader()
+	p.setContentHandler(fr)
+	p.parse(fname)
 
-def _put_sets(sets, sdir):
-	f = _openxml(sdir, 'sets.xml')
-	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-	f.write('<asofa>\n')
-	f.write('\t<sets>\n')
+	return fr.failed
 
-	# Write groups in order presented
-	for st in sets:
-		_st = {}
-		_st['id'] = esc(st['id'])
-		_st['title'] = esc(st['title'])
-		_st['description'] = esc(unesc(st['description'].replace('\n', '<br />')))
-		_st['primary'] = esc(st['primary'])
+def _put_failed(sdir, failed):
+	"""
+	Write the OrderedDict @failed of photo id to error to failed.xml, or remove failed.xml if it is empty.
+	"""
 
-		f.write('\t\t<set id="{id}" title="{title}" description="{description}" primary="{primary}">\n'.format(**_st))
+	fname = sdir + 'failed.xml'
 
-		for p in st['things']:
-			f.write('\t\t\t<photo id="%s" />\n' % p)
+	if not len(failed):
+		_landxml(fname)
 
-		f.write('\t\t</set>\n')
+		if os.path.exists(fname):
+			os.unlink(fname)
+		return
 
+	f = _openxml(sdir, 'failed.xml')
+	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+	f.write('<asofa>\n')
+	f.write('\t<failed>\n')
+	for pid,err in failed.items():
+		err = esc(err)
+		if isinstance(err, unicode): err = err.encode('utf-8')
 
-	f.write('\t</sets>\n')
+		f.write('\t\t<photo id="%s" error="%s" />\n' % (str(pid), err))
+	f.write('\t</failed>\n')
 	f.write('</asofa>\n')
 	f.close()
 
-def fsync_galleries(sdir, u, quiet):
+def _photo_hints(pht):
 	"""
-	Sync all of the galleries.
+	Get what the LISTING_EXTRAS of the <photo> element @pht of a listing tell about the photo.
+	Returns a dictionary with the lastupdate, and the geo, favorites and comments in the form fsync_photo() keeps
+	 them in when they are known without a call of their own.
 	"""
 
-	if not quiet: print 'Syncing galleries (g)...'
+	a = pht.attrib
+	hint = {}
 
-	# Pull down galleries from Flickr and write to file
-	galleries = _get_galleries(u.Flickr.FlickrAPI, u.getNSID(), quiet)
-	_put_galleries(galleries, sdir)
+	if 'lastupdate' in a:
+		hint['lastupdate'] = a['lastupdate']
 
-def _get_galleries(api, nsid, quiet):
-	# Get all galleries
-	galleries = []
+	# An accuracy of 0 means no location is set
+	if 'accuracy' in a:
+		if a['accuracy'] == '0':	hint['geo'] = None
+		else:						hint['geo'] = {'latitude': a['latitude'], 'longitude': a['longitude'], 'accuracy': a['accuracy']}
 
-	pg = 1
-	pages = 1
-	perpage = 25
+	# Only counts are given so just the lack of any is known
+	if a.get('count_faves') == '0':		hint['favorites'] = []
+	if a.get('count_comments') == '0':	hint['comments'] = []
 
-	while pg <= pages:
-		ret = api.galleries_getList(user_id=nsid, per_page=perpage, page=pg)
+	return hint
 
-		ret2 = ret.find('galleries')
-		pages = int(ret2.attrib['pages'])
+def _get_synced_lastupdate(sdir, pid):
+	"""
+	Get the last update of photo @pid recorded in its XML file when it was synced.
+	Returns None if the photo has no XML file or none was recorded.
+	"""
 
-		for g in ret2.findall('gallery'):
-			gl = {}
-			gl['id'] = g.attrib['id']
-			gl['owner'] = g.attrib['owner']
-			gl['created'] = g.attrib['date_create']
-			gl['updated'] = g.attrib['date_update']
-			gl['primary'] = g.attrib['primary_photo_id']
-			gl['title'] = g.find('title').text.encode('utf-8')
-			gl['description'] = g.find('description').text.encode('utf-8')
+	fname = sdir + 'photos/' + pid[-2:] + '/%s.xml' % pid
+	_landxml(fname)
 
-			galleries.append(gl)
+	try:
+		f = open(fname)
+	except IOError, e:
+		if e.errno == errno.ENOENT:
+			return None
+		raise
 
-		pg += 1
+	try:
+		# The <photo> element is on the third line, after the XML declaration and <asofa>
+		f.readline()
+		f.readline()
+		line = f.readline()
+	finally:
+		f.close()
 
-	# Get photos in all the galleries
-	for gl in galleries:
-		pg = 1
-		pages = 1
-		perpage = 25
+	i = line.find(' lastupdate="')
+	if i == -1:
+		return None
 
+	i += len(' lastupdate="')
+	return line[i:line.index('"', i)]
 
-		gl['things'] = []
+def _fsync_photo_list(sdir, u, quiet, pids, resume, journal, hints):
+	"""
+	Sync each photo in @pids fully, resuming at photo ID @resume if it is not None.
+	Photos recorded in @journal by an interrupted run are skipped, and each photo synced is recorded there.
+	@hints is a dictionary of photo id to what a listing told about the photo, passed on to fsync_photo().
+	With TUNING['skip_unchanged'], photos whose last update in @hints is the one they were synced at are skipped.
+	Up to TUNING['jobs'] photos are synced concurrently.
+	Photos that fail to sync are listed in failed.xml to be synced again with --retry-failed.
+	"""
 
-		while pg <= pages:
-			ret = api.galleries_getPhotos(gallery_id=gl['id'], per_page=perpage, page=pg)
-			ret2 = ret.find('photos')
-			pages = int(ret2.attrib['pages'])
+	# Failures from earlier runs stay listed until the photo syncs
+	failed = _get_failed(sdir)
 
-			gl['things'] += [{'id': p.attrib['id'], 'owner': p.attrib['owner']} for p in ret2.findall('photo')]
+	# Work out the resume point up front so that the counter still reflects the full list
+	work = []
+	cnt = 0
+	skipped = 0
+	unchanged = 0
+	resumeat = resume
+	for pid in pids:
+		# UI counter
+		cnt += 1
 
-			pg += 1
+		if resume != None:
+			if resume == pid:
+				resume = None
+			else:
+				skipped += 1
+				continue
 
-		if not quiet:
-			print "%s '%s' (%d things)" % (gl['id'], gl['title'], len(gl['things']))
+		if pid in journal:
+			continue
 
-	return galleries
+		hint = hints.get(pid, {})
 
-def _put_galleries(galleries, sdir):
-	f = _openxml(sdir, 'galleries.xml')
-	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-	f.write('<asofa>\n')
-	f.write('\t<galleries>\n')
+		if TUNING['skip_unchanged'] and 'lastupdate' in hint and pid not in failed:
+			if _get_synced_lastupdate(sdir, pid) == hint['lastupdate']:
+				unchanged += 1
+				continue
 
-	# Write groups in order presented
-	for gal in galleries:
-		f.write('\t\t<gallery id="%s" title="%s" description="%s" primary="%s">\n' % (gal['id'], (gal['title'] or '').encode('utf-8'), (gal['description'] or '').encode('utf-8'), gal['primary']))
+		work.append((pid, (cnt, len(pids)), hint))
 
-		for p in gal['things']:
-			f.write('\t\t\t<thing id="{id}" owner="{owner}" />\n'.format(**p))
+	if not quiet:
+		if skipped:
+			print 'Resuming at photo %s, skipping %d photos' % (resumeat, skipped)
 
-		f.write('\t\t</gallery>\n')
+		if len(pids) - skipped - unchanged - len(work):
+			print 'Skipping %d photos synced by an interrupted run' % (len(pids) - skipped - unchanged - len(work))
 
+		if unchanged:
+			print 'Skipping %d photos unchanged since they were synced' % unchanged
 
-	f.write('\t</galleries>\n')
-	f.write('</asofa>\n')
-	f.close()
+	def dowork(w):
+		return (w[0], _fsync_photo_try(sdir, u, quiet, w[0], w[1], w[2]))
+
+	pool = WorkerPool(TUNING['jobs'])
+	try:
+		for pid, err in pool.imap(dowork, work):
+			if err == None:
+				if pid in failed: del failed[pid]
+				journal.add(pid)
+				count('photos')
+			else:
+				say("Failed to fetch photo: %s" % pid)
+				failed[pid] = err
+				count('failed')
+	finally:
+		pool.close()
+
+		_put_failed(sdir, failed)
+
+	journal.finish()
 
-def fsync_photos(sdir, u, quiet, ids, resume=None, date=None):
+def _fsync_photo_try(sdir, u, quiet, pid, counter, hint):
 	"""
-	Sync all the photos.
+	Sync photo @pid with fsync_photo().
+	Calls that fail for a passing reason are already retried by the RetryPolicy of the FlickrAPI.
+	Returns None if the photo was synced, otherwise a description of the error.
 	"""
 
-	if not quiet: print 'Syncing photos (p)...'
-
-	pids = []
+	try:
+		fsync_photo(sdir, u, quiet, pid, counter, hint)
+		return None
 
-	if len(ids) or resume:
-		ids = [unicode(_z) for _z in ids]
+	except flickrapi.exceptions.FlickrError, e:
+		if e.code == 1:
+			say('%s Photo not found' % pid)
+		else:
+			say(e)
 
-		# Check that file doesn't exist
-		fname = sdir + 'photos.xml'
+		return unicode(e)
 
+	except Exception, e:
+		say('%s %s' % (type(e), e))
 
-		if not os.path.exists(fname):
-			raise Exception('Must have fully synchronized photos before syncing individual photos')
+		return '%s %s' % (type(e).__name__, e)
 
-		p = make_parser()
-		pr = PhotosXMLReader()
-		p.setContentHandler(pr)
-		p.parse(fname)
+class PIDList(object):
+	"""
+	Ordered photo id's (newest first, like photos.xml) made of the PhotoIndex @base and the id's inserted into it.
+	Only the inserted id's are stored apart from @base, in runs keyed by the id of @base they come before.
+	Membership and insertion next to a known id do not depend on the number of photos.
+	"""
 
-		# Merge the photos in the appropriate order
-		pids = mergePIDs(u, [_z for _z in pr.pids], [_z for _z in ids if _z not in pr.pids])
+	def __init__(self, base):
+		self.base = base
 
-	elif date != None:
-		# Get only popular photos for date @date
+		# Runs of inserted id's keyed by the id of @base they come before, None for those after the last
+		self.runs = {}
 
-		# Enumerate through date range
-		d = date[0]
-		delta = datetime.timedelta(days=1)
-		while d <= date[1]:
-			print 'Dates: %s' % (d,)
+		# Inserted id -> key of the run it is in
+		self.anchor = {}
 
-			# Multiple pages
-			pg = 1
-			pages = 1
-			perpage = 40
-			first = True
+	def __contains__(self, pid):
+		return pid in self.anchor or pid in self.base
 
-			while pg <= pages:
-				ret = u.Flickr.FlickrAPI.stats_getPopularPhotos(date=d, per_page=perpage, page=pg)
-				ret2 = ret.find('photos')
-				pages = int(ret2.attrib['pages'])
+	def __len__(self):
+		return len(self.base) + len(self.anchor)
 
-				if not quiet:
-					if first:
-						first = False
-						print 'Getting %d total pages of photos starting with page %d: ' % (pages, pg)
+	def __iter__(self):
+		for pid in self.base:
+			if pid in self.runs:
+				for _p in self.runs[pid]:
+					yield _p
 
-					if pg % 1000 == 0:
-						sys.stdout.write('M')
-					elif pg % 100 == 0:
-						sys.stdout.write('C')
-					elif pg % 10 == 0:
-						sys.stdout.write('X')
-					else:
-						# Fast enough that ever ten pages is sufficient to see progress
-						#sys.stdout.write('.')
-						pass
+			yield pid
 
-					sys.stdout.flush()
+		for _p in self.runs.get(None, []):
+			yield _p
 
-				pids += [p.attrib['id'] for p in ret2.findall('photo') if p.attrib['id'] not in pids]
+	def insert(self, pids, before=None):
+		"""
+		Insert the run of id's @pids, in order, before the id @before or at the end if None.
+		Id's already in the list are skipped.
+		"""
 
-				pg += 1
+		for pid in pids:
+			if pid in self:
+				continue
 
-			# Go to next day
-			d = d + delta
+			if before in self.anchor:
+				# Inside a run of inserted id's, just ahead of @before
+				key = self.anchor[before]
+				run = self.runs[key]
+				run.insert(run.index(before), pid)
 
-			# Add newline after MCX. outputs
-			print ''
+			else:
+				# At the end of the run ahead of a photo of @base, or of the run past the last photo
+				key = before
+				if before != None:
+					key = '%d' % int(before)
+				self.runs.setdefault(key, []).append(pid)
 
-	else:
-		# Multiple pages
-		pg = 1
-		pages = 1
-		perpage = 40
-		first = True
+			self.anchor[pid] = key
 
-		while pg <= pages:
-			ret = u.Flickr.FlickrAPI.people_getPhotos(user_id=u.getNSID(), per_page=perpage, page=pg)
-			ret2 = ret.find('photos')
-			pages = int(ret2.attrib['pages'])
+def _get_prevphoto(api, pid, contexts):
+	"""
+	Get the id of the photo uploaded before @pid, or None if @pid is the oldest.
+	Answers are memoized in @contexts (pid -> prev pid).
+	"""
 
-			if not quiet:
-				if first:
-					first = False
-					print 'Getting %d total pages of photos starting with page %d: ' % (pages, pg)
+	if pid not in contexts:
+		ret = api.photos_getContext(photo_id=pid)
+		_p = unicode(ret.find('prevphoto').attrib['id'])
 
-				if pg % 1000 == 0:
-					sys.stdout.write('M')
-				elif pg % 100 == 0:
-					sys.stdout.write('C')
-				elif pg % 10 == 0:
-					sys.stdout.write('X')
-				else:
-					sys.stdout.write('.')
+		# Flickr uses an id of 0 past the oldest photo
+		if _p == u'0':
+			_p = None
 
-				sys.stdout.flush()
+		contexts[pid] = _p
 
-			pids += [p.attrib['id'] for p in ret2.findall('photo')]
+	return contexts[pid]
 
-			pg += 1
+def _merge_listing(api, nsid, pids, new):
+	"""
+	Place the id's in @new into @pids from the people_getPhotos listing, which is newest first like photos.xml.
+	Pages are read until every id is followed by a known photo or the listing ends, but never more pages than
+	there are id's as that is what walking the contexts would cost.
+	Returns the id's that could not be placed.
+	"""
 
-		# Add newline after MCX. outputs
-		print ''
+	wanted = set(new)
+	listing = []
+	found = 0
+	complete = False
 
+	pg = 1
+	pages = 1
+	perpage = PERPAGE['flickr.people.getPhotos']
 
-	if date == None:
-		# Save a copy of the photo id's only
-		# Don't do if date is provided
+	while pg <= pages and pg <= len(new):
+		ret = api.people_getPhotos(user_id=nsid, per_page=perpage, page=pg, format='stream')
+		pages = int(ret.attrib['pages'])
 
-		f = _openxml(sdir, 'photos.xml')
-		f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-		f.write('<asofa>\n')
-		f.write('\t<photos>\n')
-		for pid in pids:
-			f.write('\t\t<photo id="%s" />\n' % pid)
-		f.write('\t</photos>\n')
-		f.write('</asofa>\n')
-		f.close()
+		for p in ret:
+			pid = unicode(p.attrib['id'])
+			listing.append(pid)
 
-	# Pull down each photo fully
-	cnt = 0
-	if len(ids):
-		# Trim out empty pids
-		ids = [_i for _i in ids if len(_i)]
+			if pid in wanted:
+				found += 1
 
-		for pid in ids:
-			# UI counter
-			cnt += 1
+			# A known photo after the last wanted one anchors them all
+			elif found == len(wanted) and pid in pids:
+				complete = True
+				break
 
-			if resume != None:
-				if resume == pid:
-					resume = None
-				else:
-					if not quiet:
-						print '%6d of %6d: %s SKIPPING TO RESUME TO %s' % (cnt, len(ids), pid, resume)
-					continue
+		if complete:
+			break
 
-			# Try 5 times
-			plztry = 5
-			while plztry > 0:
-				try:
-					fsync_photo(sdir, u, quiet, pid, (cnt, len(ids)))
-					break
-				except Exception, e:
-					print e
+		pg += 1
 
-				plztry -= 1
-			if plztry == 0:
-				print "Failed to fetch photo: %s" % pid
-				sys.exit(-1);
+	# Read to the end, so the oldest photos go at the end
+	if pg > pages:
+		complete = True
 
-	else:
-		# Trim out empty pids (could be from a deleted photo as pulled down for a day's stats)
-		pids = [_i for _i in pids if len(_i)]
-		for pid in pids:
-			# UI counter
-			cnt += 1
+	# Oldest first, inserting each wanted id before the photo that follows it
+	before = None
+	anchored = complete
+	for pid in reversed(listing):
+		if pid in pids:
+			before = pid
+			anchored = True
 
-			if resume != None:
-				if resume == pid:
-					resume = None
-				else:
-					if not quiet:
-						print '%6d of %6d: %s SKIPPING TO RESUME TO %s' % (cnt, len(pids), pid, resume)
-					continue
+		elif pid in wanted and anchored:
+			pids.insert([pid], before)
+			before = pid
 
-			# Try 5 times
-			plztry = 5
-			while plztry > 0:
-				try:
-					fsync_photo(sdir, u, quiet, pid, (cnt, len(pids)))
-					break
-				except flickrapi.exceptions.FlickrError, e:
-					if e.code == 1:
-						print pid, 'Photo not found'
-					else:
-						print e
-
-				except Exception, e:
-					print type(e), e
-
-				plztry -= 1
-			if plztry == 0:
-				print "Failed to fetch photo: %s" % pid
-				sys.exit(-1);
+	return [_z for _z in new if _z not in pids]
 
 def mergePIDs(u, existing, new):
 	"""
-	Merge photo id's in @new into @existing using the context to find the appropriate place.
+	Merge photo id's in @new into the PhotoIndex @existing using the context to find the appropriate place.
+	Returns a list of all the photo id's.
 	"""
 
-	for pid in new:
-		order = [pid]
+	pids = PIDList(existing)
+	contexts = {}
+
+	# Newest first, so a run of neighbouring new photos is walked once from its newest photo and the others are
+	# already placed by the time they come up
+	new = sorted(set([_z for _z in new if _z not in pids]), key=int, reverse=True)
 
+	if TUNING['merge_listing'] and len(new) >= TUNING['merge_listing']:
+		new = _merge_listing(u.Flickr.FlickrAPI, u.getNSID(), pids, new)
+
+	for pid in new:
 		# PID is in existing now (put in there by processing another pid in @new)
-		if pid in existing:
+		if pid in pids:
 			continue
 
-		# Find previous pid until a pid is found
+		# Find previous pid until a known pid is found, newer photos come first
+		order = [pid]
 		_p = pid
 		while True:
-			ret = u.Flickr.FlickrAPI.photos_getContext(photo_id=_p)
-			_p = ret.find('prevphoto').attrib['id']
-
-			_p = unicode(_p)
-
-			if _p in existing:
-				# Find where this photo id is in the existing array
-				idx = index(existing, lambda x: x == _p)
-
-				# Merge the order set of photo id's that are not in the list and insert before
-				# the index of the found photo id
-				if idx == 0:
-					existing = order + existing
-				else:
-					existing = existing[0:idx] + order + existing[idx:-1]
+			_p = _get_prevphoto(u.Flickr.FlickrAPI, _p, contexts)
 
+			if _p == None or _p in pids:
+				# Insert the run before the known photo, or at the end past the oldest photo
+				pids.insert(order, _p)
 				break
 
 			else:
 				# Could not find @_p in @existing, so append to @order and keep going
 				order.append(_p)
 
-	return existing
+	return list(pids)
 
 
-def fsync_photo(sdir, u, quiet, pid, counter):
+def fsync_photo(sdir, u, quiet, pid, counter, hint=None):
 	"""
 	Sync a specific photo with ID @pid.
 	@counter is a 2-tuple of (current counter, total) to show as a UI counter.
+	@hint is what a listing told about the photo (see _photo_hints()), whatever is in it is not fetched again.
 	"""
 
+	if hint == None:
+		hint = {}
+
 	p = {}
-	p['info'] = fsync_photo_info(sdir, u, quiet, pid)
-	p['exif'] = getExif(u, pid, p['info']['secret'])
-	p['favorites'] = getFavorites(u, pid)
-	p['comments'] = getComments_photo(u, pid)
-	p['geo'] = getLocation(u, pid)
-	p['contexts'] = getContexts(u, pid)
-	p['people'] = getPeople(u, pid)
+	for key in ('favorites', 'comments', 'geo'):
+		if key in hint:
+			p[key] = hint[key]
+
+	# Calls for everything else besides the info and EXIF
+	calls = [(key,func) for key,func in (('favorites', getFavorites), ('comments', getComments_photo), ('geo', getLocation), ('contexts', getContexts), ('people', getPeople)) if key not in p]
+
+	if TUNING['fanout']:
+		# Only the EXIF depends on the info (it needs the secret) so everything else is fetched alongside that pair
+		r = fanout((_fsync_photo_info_exif, sdir, u, quiet, pid), *[(func, u, pid) for key,func in calls])
+
+		p['info'], p['exif'] = r[0]
+		for (key,func),ret in zip(calls, r[1:]):
+			p[key] = ret
+
+	else:
+		p['info'] = fsync_photo_info(sdir, u, quiet, pid)
+		p['exif'] = getExif(u, pid, p['info']['secret'])
+
+		for key,func in calls:
+			p[key] = func(u, pid)
+
+	if p['info']['lastupdate'] == None:
+		p['info']['lastupdate'] = hint.get('lastupdate')
 
 	if not quiet:
-		print '%6d of %6d: %s "%s"' % (counter[0], counter[1], p['info']['id'], p['info']['title'])
+		say('%6d of %6d: %s "%s"' % (counter[0], counter[1], p['info']['id'], p['info']['title']))
 
 
 	# Determine folder the file will be in
 	folder = pid[-2:]
 
 	# Make sure directory exists
-	if not os.path.exists(sdir):
-		os.mkdir(sdir)
+	_mkdir(sdir)
 
 	fname = sdir + 'photos/'
-	if not os.path.exists(fname):
-		os.mkdir(fname)
+	_mkdir(fname)
 
 	fname += folder + '/'
 
@@ -1259,7 +2663,13 @@ def fsync_photo(sdir, u, quiet, pid, counter):
 	f.write('<?xml version="1.0" encoding="utf-8"?>\n')
 	f.write('<asofa>\n')
 
-	f.write('\t<photo id="{id}" farm="{farm}" server="{server}" license="{license}" rot="{rot}" secret="{secret}" orignalsecret="{origsecret}" originalformat="{origformat}" media="{media}" views="{views}" ispublic="{ispublic}" isfriend="{isfriend}" isfamily="{isfamily}" permcomment="{permcomment}" permaddmeta="{permaddmeta}">\n'.format(**p['info']))
+	f.write('\t<photo id="{id}" farm="{farm}" server="{server}" license="{license}" rot="{rot}" secret="{secret}" orignalsecret="{origsecret}" originalformat="{origformat}" media="{media}" views="{views}" ispublic="{ispublic}" isfriend="{isfriend}" isfamily="{isfamily}" permcomment="{permcomment}" permaddmeta="{permaddmeta}"'.format(**p['info']))
+
+	# Recorded to tell next time whether the photo changed since
+	if p['info']['lastupdate'] != None:
+		f.write(' lastupdate="%s"' % p['info']['lastupdate'])
+	f.write('>\n')
+
 	f.write('\t\t<uploaded raw="%s">%s</uploaded>\n' % (p['info']['uploaded'], datetime.datetime.fromtimestamp(float(p['info']['uploaded']))))
 
 	# Title may not be set
@@ -1355,6 +2765,15 @@ def fsync_photo(sdir, u, quiet, pid, counter):
 	f.write('</asofa>')
 	f.close()
 
+def _fsync_photo_info_exif(sdir, u, quiet, pid):
+	"""
+	Fetch the info and then the EXIF of photo @pid, since the EXIF needs the secret from the info.
+	Returns a 2-tuple of (info, exif).
+	"""
+
+	info = fsync_photo_info(sdir, u, quiet, pid)
+	return (info, getExif(u, pid, info['secret']))
+
 def fsync_photo_info(sdir, u, quiet, pid):
 	"""
 	Fetch the "info" for a photo.
@@ -1381,6 +2800,11 @@ def fsync_photo_info(sdir, u, quiet, pid):
 	photo['media'] = p.attrib['media']
 	photo['views'] = p.attrib['views']
 
+	# Only the last update is needed from the dates
+	d = p.find('dates')
+	if d != None:	photo['lastupdate'] = d.attrib.get('lastupdate')
+	else:			photo['lastupdate'] = None
+
 	v = p.find('visibility')
 	photo['ispublic'] = int(v.attrib['ispublic'])
 	photo['isfriend'] = int(v.attrib['isfriend'])
@@ -1428,28 +2852,15 @@ def getFavorites(u, pid):
 
 	favret = []
 
-	pg = 1
-	pages = 1
-	perpage = 25
-
-	while pg <= pages:
-		ret = u.Flickr.FlickrAPI.photos_getFavorites(photo_id=pid, per_page=perpage, page=pg)
-
-		photo = ret.find('photo')
-		pages = int(photo.attrib['pages'])
-
-		persons = photo.getchildren()
-		for person in persons:
-			nsid = person.attrib['nsid']
-			uname = person.attrib['username'].encode('utf-8')
-			fdate = person.attrib['favedate']
-
-			fdt = datetime.datetime.fromtimestamp(float(fdate))
+	for person in paginate(u.Flickr.FlickrAPI.photos_getFavorites, prefetch=False, photo_id=pid):
+		nsid = person.attrib['nsid']
+		uname = person.attrib['username'].encode('utf-8')
+		fdate = person.attrib['favedate']
 
-			z = {'nsid': nsid, 'username': uname, 'date': fdt, 'favdate': fdate}
-			favret.append(z)
+		fdt = datetime.datetime.fromtimestamp(float(fdate))
 
-		pg += 1
+		z = {'nsid': nsid, 'username': uname, 'date': fdt, 'favdate': fdate}
+		favret.append(z)
 
 	return favret
 
@@ -1601,19 +3012,7 @@ def getContexts(u, pid):
 
 	# Get galleries
 	# Flickr does not consider a gallery a "context" but I will to consolidate them
-	pg = 1
-	pages = 1
-	perpage = 25
-
-	while pg <= pages:
-		ret = u.Flickr.FlickrAPI.galleries_getListForPhoto(photo_id=pid, per_page=perpage, page=pg)
-
-		ret2 = ret.find('galleries')
-		pages = int(ret2.attrib['pages'])
-
-		contexts['galleries'] = [g.attrib['id'] for g in ret2.findall('gallery')]
-
-		pg += 1
+	contexts['galleries'] = [g.attrib['id'] for g in paginate(u.Flickr.FlickrAPI.galleries_getListForPhoto, prefetch=False, photo_id=pid)]
 
 
 	return contexts
@@ -1652,13 +3051,19 @@ def fsync_profile(sdir, u, quiet):
 	Sync the auth's user profile.
 	"""
 
-	prof = _get_profile(u.Flickr.FlickrAPI, u.getNSID(), quiet)
+	prof = _get_profile(u.Flickr.FlickrAPI, u.getNSID(), quiet, u.Info)
 	_put_profile(prof, sdir)
 
-def _get_profile(api, nsid, quiet):
+def _get_profile(api, nsid, quiet, info=None):
+	"""
+	Get the profile of user @nsid.
+	@info is the people_getInfo response for the user if it has already been fetched.
+	"""
+
 	# Get basic user information
-	ret = api.people_getInfo(user_id=nsid)
-	p = ret.find('person')
+	if info == None:
+		info = api.people_getInfo(user_id=nsid)
+	p = info.find('person')
 
 	# Accumulate profile here
 	prof = {}
@@ -1754,8 +3159,8 @@ class Flickr:
 	Container to wrap the flickrapi module.
 	"""
 
-	def __init__(self, api_key, secret_key=None):
-		self._Flickr = flickrapi.FlickrAPI(api_key, secret_key, format='etree')
+	def __init__(self, api_key, secret_key=None, connections=8):
+		self._Flickr = flickrapi.FlickrAPI(api_key, secret_key, format='etree', pool_size=connections)
 
 	def getFlickrAPI(self): return self._Flickr
 	FlickrAPI = property(getFlickrAPI, doc='Gets the flickrapi object')
@@ -1785,7 +3190,9 @@ class Flickr:
 class User:
 	"""
 	Represents a user.
-	Flickr, NSID, Username, RealName, IsPro, Location, PhotosURL, and ProfileURL are immediately available.
+	Flickr and NSID are immediately available.
+	Username, RealName, IsPro, Location, PhotosURL, and ProfileURL come from a single people_getInfo call made the
+	 first time any of them, or Info, is needed.
 	All other properties are dynamically loaded on demand.
 	"""
 
@@ -1793,17 +3200,25 @@ class User:
 		self._Flickr = flickr
 		self._NSID = nsid
 
-		info = self.Flickr.FlickrAPI.people_getInfo(user_id=self.NSID)
+		self._Info = None
+		self._InfoLock = threading.Lock()
+
+		self._Photosets = None
 
-		self._Username = info[0].find('username').text
-		self._RealName = info[0].find('realname').text
+	def getInfo(self):
+		"""
+		Get the people_getInfo response for the user, which is only called for once.
+		"""
 
-		self._IsPro = info[0].attrib['ispro'] != 0
-		self._Location = info[0].find('location').text
-		self._PhotosURL = info[0].find('photosurl').text
-		self._ProfileURL = info[0].find('profileurl').text
+		self._InfoLock.acquire()
+		try:
+			if self._Info == None:
+				self._Info = self.Flickr.FlickrAPI.people_getInfo(user_id=self.NSID)
 
-		self._Photosets = None
+			return self._Info
+		finally:
+			self._InfoLock.release()
+	Info = property(getInfo)
 
 	def getFlickr(self): return self._Flickr
 	Flickr = property(getFlickr)
@@ -1811,23 +3226,23 @@ class User:
 	def getNSID(self): return self._NSID
 	NSID = property(getNSID)
 
-	def getUsername(self): return self._Username
+	def getUsername(self): return self.Info[0].find('username').text
 	Username = property(getUsername)
 
-	def getRealName(self): return self._RealName
+	def getRealName(self): return self.Info[0].find('realname').text
 	RealName = property(getRealName)
 
 
-	def getIsPro(self): return self._IsPro
+	def getIsPro(self): return self.Info[0].attrib['ispro'] != '0'
 	IsPro = property(getIsPro)
 
-	def getLocation(self): return self._Location
+	def getLocation(self): return self.Info[0].find('location').text
 	Location = property(getLocation)
 
-	def getPhotosURL(self): return self._PhotosURL
+	def getPhotosURL(self): return self.Info[0].find('photosurl').text
 	PhotosURL = property(getPhotosURL)
 
-	def getProfileURL(self): return self._ProfileURL
+	def getProfileURL(self): return self.Info[0].find('profileurl').text
 	ProfileURL = property(getProfileURL)
 
 
@@ -0,0 +1,136 @@
+"""
+Tests of sync.py that run without Flickr, against a fake API holding a made up photostream.
+
+Run with: python -m unittest test_sync
+"""
+
+import unittest
+from xml.etree import ElementTree
+
+import sync
+from idarray import PhotoIndex
+
+class FakeAPI:
+	"""
+	The parts of FlickrAPI that mergePIDs() calls, answering from the photo id's @stream, newest first.
+	Calls are counted by method name in self.calls.
+	"""
+
+	def __init__(self, stream):
+		self.stream = stream
+		self.calls = {}
+
+	def _call(self, name):
+		self.calls[name] = self.calls.get(name, 0) + 1
+
+	def photos_getContext(self, photo_id):
+		self._call('photos_getContext')
+
+		# Flickr gives an id of 0 past the oldest photo
+		idx = self.stream.index(photo_id)
+		if idx + 1 < len(self.stream):
+			prev = self.stream[idx + 1]
+		else:
+			prev = '0'
+
+		ret = ElementTree.Element('rsp')
+		ElementTree.SubElement(ret, 'prevphoto', id=prev)
+		return ret
+
+	def people_getPhotos(self, user_id, per_page, page, format):
+		self._call('people_getPhotos')
+
+		pids = self.stream[(page - 1) * per_page:page * per_page]
+
+		ret = ElementTree.Element('photos', pages=str((len(self.stream) + per_page - 1) // per_page))
+		for pid in pids:
+			ElementTree.SubElement(ret, 'photo', id=pid)
+		return ret
+
+class FakeUser:
+	"""
+	Stands in for sync.User, with @api as its FlickrAPI.
+	"""
+
+	def __init__(self, api):
+		self.Flickr = self
+		self.FlickrAPI = api
+
+	def getNSID(self):
+		return '12345678@N00'
+
+class MergePIDsTest(unittest.TestCase):
+	"""
+	Tests of mergePIDs() putting new photo id's where they belong among the photo id's of photos.xml.
+	"""
+
+	def setUp(self):
+		self.tuning = sync.TUNING.copy()
+
+		# The getContext walk unless a test says otherwise
+		sync.TUNING['merge_listing'] = 0
+
+		self.stream = ['%d' % pid for pid in xrange(100, 0, -10)]
+		self.api = FakeAPI(self.stream)
+		self.u = FakeUser(self.api)
+
+	def tearDown(self):
+		sync.TUNING.clear()
+		sync.TUNING.update(self.tuning)
+
+	def merge(self, new):
+		existing = PhotoIndex([pid for pid in self.stream if pid not in new])
+
+		return sync.mergePIDs(self.u, existing, [unicode(pid) for pid in new])
+
+	def test_before_known(self):
+		self.assertEqual(self.merge(['70']), self.stream)
+		self.assertEqual(self.api.calls, {'photos_getContext': 1})
+
+	def test_keeps_last(self):
+		# Inserting between two known photos used to drop the last photo of photos.xml
+		pids = self.merge(['50'])
+
+		self.assertEqual(pids, self.stream)
+		self.assertEqual(pids[-1], '10')
+
+	def test_run(self):
+		# A run of neighbouring new photos is walked once, from the newest
+		self.assertEqual(self.merge(['60', '80', '70']), self.stream)
+		self.assertEqual(self.api.calls, {'photos_getContext': 3})
+
+	def test_newest(self):
+		self.assertEqual(self.merge(['100', '90']), self.stream)
+
+	def test_oldest(self):
+		# Past the oldest photo the context is 0, so the run goes at the end
+		self.assertEqual(self.merge(['20', '10']), self.stream)
+		self.assertEqual(self.api.calls, {'photos_getContext': 2})
+
+	def test_known(self):
+		# Id's already in photos.xml stay where they are
+		pids = sync.mergePIDs(self.u, PhotoIndex(self.stream), [u'50'])
+
+		self.assertEqual(pids, self.stream)
+		self.assertEqual(self.api.calls, {})
+
+	def test_listing(self):
+		sync.TUNING['merge_listing'] = 3
+
+		self.assertEqual(self.merge(['90', '50', '40', '10']), self.stream)
+		self.assertEqual(self.api.calls, {'people_getPhotos': 1})
+
+	def test_listing_pages(self):
+		sync.TUNING['merge_listing'] = 2
+		perpage = sync.PERPAGE['flickr.people.getPhotos']
+		sync.PERPAGE['flickr.people.getPhotos'] = 3
+
+		try:
+			# Ends on the second page once the known photo after the last new one is seen
+			self.assertEqual(self.merge(['90', '60']), self.stream)
+			self.assertEqual(self.api.calls, {'people_getPhotos': 2})
+		finally:
+			sync.PERPAGE['flickr.people.getPhotos'] = perpage
+
+if __name__ == '__main__':
+	unittest.main()